@@ -46,7 +46,8 @@ class BBCodeTagAdmin(admin.ModelAdmin):
         response = actions.delete_selected(self, request, queryset)
 
         if response is None:
-            [parser.bbcodes.pop(n) for n in tag_names]
+            for tag_name in tag_names:
+                parser.remove_bbcode_tag(tag_name)
 
         return response
 
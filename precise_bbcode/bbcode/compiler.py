@@ -0,0 +1,265 @@
+import hashlib
+import importlib.util
+import os
+import stat
+import tempfile
+
+from precise_bbcode.bbcode.tag import BBCodeTag
+from precise_bbcode.conf import settings as bbcode_settings
+
+
+# The version of the generated code ; it is part of the hash of the compiled tag sets so that the
+# modules generated by a previous version of the compiler are not reused
+COMPILER_VERSION = 1
+
+# The prefix of the names of the modules written in the cache directory
+MODULE_PREFIX = 'precise_bbcode_tags_'
+
+# The compiled module that was last loaded by the current process, keyed by its tag set hash ; the
+# modules of the previous tag sets are not kept since the tags can be changed at runtime
+_compiled_modules = {}
+
+
+def uses_default_rendering(tag):
+    """
+    Returns True if the given tag is rendered by the generic rendering method of the BBCodeTag
+    class, that is if it is defined by a definition string and a format string and if it does not
+    override any of the methods involved in its rendering.
+    """
+    tag_klass = type(tag)
+    return bool(tag.definition_string and tag.format_string) \
+        and tag_klass.do_render is BBCodeTag.do_render \
+        and tag_klass._render_default is BBCodeTag._render_default \
+        and tag_klass._validate_format is BBCodeTag._validate_format
+
+
+def can_compile(tag):
+    """
+    Returns True if a render function can be generated for the given tag.
+    """
+    return uses_default_rendering(tag) and len(tag._render_plan.placeholder_contexts) <= 2
+
+
+def get_tags_hash(tags):
+    """
+    Returns the hash of the definitions of the given tags that can be compiled.
+    """
+    definitions = repr([
+        (tag.name, tag.definition_string, tag.format_string)
+        for tag in sorted(tags, key=lambda t: t.name) if can_compile(tag)])
+    return hashlib.sha1(
+        '{}:{}'.format(COMPILER_VERSION, definitions).encode('utf-8')).hexdigest()
+
+
+def _generate_render_function(tag_id, tag):
+    """
+    Returns the lines of the source of a factory function which, given the validators of the
+    placeholders of the specified tag, returns a function rendering this tag.
+    """
+    render_plan = tag._render_plan
+    # The content of the tag and its escaped option are stored in the 'value' and 'option_value'
+    # variables of the render function
+    variables = {}
+    if render_plan.content_placeholder:
+        variables[render_plan.content_placeholder] = 'value'
+    if render_plan.option_placeholder:
+        variables[render_plan.option_placeholder] = 'option_value'
+
+    lines = [
+        '# {}'.format(tag.name),
+        'def make_render_{}(validators):'.format(tag_id),
+    ]
+    # The placeholders are validated in the order used by BBCodeTag._render_default: the content
+    # first and the option then
+    validations = []
+    for validator_id, placeholder in enumerate(
+            p for p in (render_plan.content_placeholder, render_plan.option_placeholder) if p):
+        lines.append('    validate_{} = validators[{!r}]'.format(validator_id, placeholder))
+        validations.append('validate_{}({})'.format(validator_id, variables[placeholder]))
+
+    lines.append('')
+    lines.append('    def render_{}(parser, value, option=None, parent=None):'.format(tag_id))
+    if not variables:
+        lines.append('        return {!r}'.format(''.join(render_plan.format_parts)))
+    else:
+        if render_plan.option_placeholder:
+            lines.append(
+                '        option_value = replace(option, bbcode_settings.BBCODE_ESCAPE_HTML) '
+                'if option else \'\'')
+        format_values = ', '.join(variables[p] for p in render_plan.format_placeholders)
+        definition_values = ', '.join(variables[p] for p in render_plan.definition_placeholders)
+        lines.extend([
+            '        if {}:'.format(' and '.join(validations)),
+            '            return {!r} % ({},)'.format(render_plan.format_template, format_values),
+            '        if option:',
+            '            return {!r} % ({},)'.format(
+                render_plan.definition_template, definition_values),
+            '        return ({!r} % ({},)).replace(\'=\', \'\')'.format(
+                render_plan.definition_template, definition_values),
+        ])
+    lines.append('')
+    lines.append('    return render_{}'.format(tag_id))
+    return lines
+
+
+def generate_source(tags):
+    """
+    Returns the source of a Python module defining a render function factory for each of the given
+    tags that can be compiled. These factories are available through the RENDER_FACTORIES
+    dictionary of the module, keyed by tag names.
+    """
+    compiled_tags = sorted((tag for tag in tags if can_compile(tag)), key=lambda t: t.name)
+    lines = [
+        '# -*- coding: utf-8 -*-',
+        '# This module was generated by precise_bbcode.bbcode.compiler ; do not edit it.',
+        'from precise_bbcode.conf import settings as bbcode_settings',
+        'from precise_bbcode.core.utils import replace',
+        '',
+        'TAGS_HASH = {!r}'.format(get_tags_hash(tags)),
+    ]
+    for tag_id, tag in enumerate(compiled_tags):
+        lines.append('')
+        lines.append('')
+        lines.extend(_generate_render_function(tag_id, tag))
+    lines.append('')
+    lines.append('')
+    lines.append('RENDER_FACTORIES = {')
+    for tag_id, tag in enumerate(compiled_tags):
+        lines.append('    {!r}: make_render_{},'.format(tag.name, tag_id))
+    lines.append('}')
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def get_cache_dir():
+    """
+    Returns the directory where the generated modules are cached, or None if they should only be
+    kept in memory.
+    """
+    return bbcode_settings.BBCODE_COMPILED_TAGS_DIR
+
+
+def _is_private(path):
+    """
+    Returns True if the given file or directory is owned by the current user and cannot be written
+    by the other users. The generated modules are executed when they are loaded: they are never
+    loaded from a location that another user could tamper with.
+    """
+    if not hasattr(os, 'getuid'):
+        return False
+    stat_result = os.stat(path)
+    return stat_result.st_uid == os.getuid() \
+        and not stat_result.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _load_module(module_name, path):
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _exec_module(module_name, source):
+    module = type(os)(module_name)
+    exec(compile(source, '<{}>'.format(module_name), 'exec'), module.__dict__)
+    return module
+
+
+def _remove_stale_modules(cache_dir, module_name):
+    """
+    Removes the modules generated for other tag sets from the given cache directory, as well as
+    their compiled bytecode.
+    """
+    for directory in (cache_dir, os.path.join(cache_dir, '__pycache__')):
+        try:
+            filenames = os.listdir(directory)
+        except OSError:
+            continue
+        for filename in filenames:
+            if filename.startswith(MODULE_PREFIX) and not filename.startswith(module_name + '.'):
+                try:
+                    os.unlink(os.path.join(directory, filename))
+                except OSError:
+                    pass
+
+
+def _write_source(path, source):
+    # The source is written to a temporary file which is then renamed so that concurrent processes
+    # never load a partially written module
+    fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(source)
+        os.replace(temporary_path, path)
+    except Exception:
+        os.unlink(temporary_path)
+        raise
+
+
+def load_compiled_tags(tags, cache_dir=None):
+    """
+    Returns the module generated for the given tags. This module is loaded from the cache
+    directory if it was already generated for the same tag definitions, by the current process or
+    by another one. Otherwise it is generated and written to the cache directory, from which the
+    modules generated for the previous tag definitions are removed. The module is only loaded
+    from memory if no cache directory is configured or if this directory cannot be written or is
+    not private to the current user.
+    """
+    tags_hash = get_tags_hash(tags)
+    if tags_hash in _compiled_modules:
+        return _compiled_modules[tags_hash]
+
+    module_name = MODULE_PREFIX + tags_hash
+    cache_dir = cache_dir or get_cache_dir()
+    module = None
+    is_private_dir = False
+    if cache_dir:
+        path = os.path.join(cache_dir, module_name + '.py')
+        try:
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+            is_private_dir = _is_private(cache_dir)
+        except OSError:
+            is_private_dir = False
+        if is_private_dir and os.path.exists(path) and _is_private(path):
+            try:
+                module = _load_module(module_name, path)
+            except Exception:
+                # The cached module is not valid: it will be generated again
+                module = None
+            if module is not None and getattr(module, 'TAGS_HASH', None) != tags_hash:
+                module = None
+
+    if module is None:
+        source = generate_source(tags)
+        if is_private_dir:
+            try:
+                _write_source(path, source)
+                _remove_stale_modules(cache_dir, module_name)
+                module = _load_module(module_name, path)
+            except OSError:
+                module = None
+        if module is None:
+            module = _exec_module(module_name, source)
+
+    _compiled_modules.clear()
+    _compiled_modules[tags_hash] = module
+    return module
+
+
+def get_renderers(tags, cache_dir=None):
+    """
+    Returns a tuple containing a render function for each of the given tags. The generated render
+    functions are used for the tags that can be compiled and whose placeholders are all bound to a
+    validator ; the 'do_render' method of the tag is used for any other tag.
+    """
+    render_factories = load_compiled_tags(tags, cache_dir).RENDER_FACTORIES
+    renderers = []
+    for tag in tags:
+        render_factory = render_factories.get(tag.name)
+        validators = tag._placeholder_validators or {}
+        if render_factory is not None and can_compile(tag) \
+                and all(p in validators for p in tag._render_plan.placeholder_contexts):
+            renderers.append(render_factory(validators))
+        else:
+            renderers.append(tag.do_render)
+    return tuple(renderers)
@@ -1,9 +1,7 @@
 import re
 
-from django.core.exceptions import ValidationError
-from django.core.validators import URLValidator
-
 from precise_bbcode.bbcode.placeholder import BBCodePlaceholder
+from precise_bbcode.core.validators import url_validator
 
 
 __all__ = [
@@ -30,12 +28,7 @@ class UrlBBCodePlaceholder(BBCodePlaceholder):
     name = 'url'
 
     def validate(self, content, extra_context=None):
-        v = URLValidator()
-        try:
-            v(content)
-        except ValidationError:
-            return False
-        return True
+        return url_validator.is_valid(content)
 
 
 class EmailBBCodePlaceholder(BBCodePlaceholder):
@@ -83,6 +76,23 @@ class RangeBBCodePlaceholder(BBCodePlaceholder):
 
         return True
 
+    def get_validator(self, extra_context=None):
+        if type(self).validate is not RangeBBCodePlaceholder.validate:
+            return super(RangeBBCodePlaceholder, self).get_validator(extra_context)
+        try:
+            min_content, max_content = (extra_context or '').split(',')
+            min_value, max_value = float(min_content), float(max_content)
+        except ValueError:
+            return lambda content: False
+
+        def validator(content):
+            try:
+                value = float(content)
+            except ValueError:
+                return False
+            return min_value <= value <= max_value
+        return validator
+
 
 class ChoiceBBCodePlaceholder(BBCodePlaceholder):
     name = 'choice'
@@ -90,3 +100,8 @@ class ChoiceBBCodePlaceholder(BBCodePlaceholder):
     def validate(self, content, extra_context):
         choices = extra_context.split(',')
         return content in choices
+
+    def get_validator(self, extra_context=None):
+        if type(self).validate is not ChoiceBBCodePlaceholder.validate:
+            return super(ChoiceBBCodePlaceholder, self).get_validator(extra_context)
+        return frozenset((extra_context or '').split(',')).__contains__
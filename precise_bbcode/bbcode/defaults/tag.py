@@ -1,11 +1,9 @@
 import re
 
-from django.core.exceptions import ValidationError
-from django.core.validators import URLValidator
-
 from precise_bbcode.bbcode.tag import BBCodeTag
 from precise_bbcode.conf import settings as bbcode_settings
 from precise_bbcode.core.utils import replace
+from precise_bbcode.core.validators import url_validator
 
 
 class StrongBBCodeTag(BBCodeTag):
@@ -112,12 +110,9 @@ class UrlBBCodeTag(BBCodeTag):
         href = replace(href, bbcode_settings.BBCODE_ESCAPE_HTML)
         if '://' not in href and self._domain_re.match(href):
             href = 'http://' + href
-        v = URLValidator()
 
         # Validates and renders the considered URL.
-        try:
-            v(href)
-        except ValidationError:
+        if not url_validator.is_valid(href):
             rendered = '[url={}]{}[/url]'.format(href, value) if option else \
                 '[url]{}[/url]'.format(value)
         else:
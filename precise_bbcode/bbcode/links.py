@@ -0,0 +1,146 @@
+import re
+
+
+# The links found in the textual contents are the ones matched by the url_re regex. This regex
+# relies on nested quantifiers that can backtrack exponentially on long runs of URL-like characters
+# that have no valid ending. The following functions find the same links in linear time: each link
+# is decomposed into a prefix (a scheme, 'www' or a domain name followed by a slash) and a body
+# whose parts are matched by regexes that never backtrack more than once over each character.
+
+# Each link starts with a scheme or with 'www' or contains a domain name followed by a slash in its
+# leading run of domain name characters. These anchors are cheap to find: the links are only
+# matched around them. The anchors are given as (first characters, rest) pairs.
+LINK_ANCHORS = (
+    ('hH', r'(?i:ttps?://)'),
+    ('wW', r'(?i:ww\d{0,3}[.])'),
+    ('.', r'(?i:[a-z]{2,4}/)'),
+)
+_link_anchor_re = re.compile('[{}](?:{})'.format(
+    ''.join(re.escape(chars) for chars, _ in LINK_ANCHORS),
+    '|'.join('(?<=[{}]){}'.format(re.escape(chars), rest) for chars, rest in LINK_ANCHORS)))
+
+_word_re = re.compile(r'\w')
+_scheme_re = re.compile(r'https?://', flags=re.I)
+_www_re = re.compile(r'www\d{0,3}[.]', flags=re.I)
+_domain_char_re = re.compile(r'[a-z0-9.\-]', flags=re.I)
+_domain_chars_re = re.compile(r'[a-z0-9.\-]*', flags=re.I)
+_domain_suffix_re = re.compile(r'[.][a-z]{2,4}/', flags=re.I)
+
+# The body of a link is a sequence of characters and of parenthesized groups whose last element is
+# a group or a character that can end a link. The body extent is the longest such sequence and the
+# body ends at its last allowed ending.
+_link_body_extent_re = re.compile(r'(?:[^\s()<>]+|\([^\s()<>]+\))*')
+_link_body_re = re.compile(r'(?s).*[^\s`!(\[\]{};:\'".,<>?]')
+
+
+def _match_link_body(data, pos):
+    """
+    Returns the end of the body of a link starting at the given position, or None.
+    """
+    extent = _link_body_extent_re.match(data, pos).end()
+    body = _link_body_re.match(data, pos, extent)
+    if not body:
+        return None
+    end = body.end()
+    # The body must contain at least two elements
+    if end == pos + 1 or (data[pos] == '(' and data.find(')', pos) == end - 1):
+        return None
+    return end
+
+
+def _is_word_boundary(data, pos):
+    is_word_before = pos > 0 and _word_re.match(data, pos - 1) is not None
+    return is_word_before != (pos < len(data) and _word_re.match(data, pos) is not None)
+
+
+class LinkMatcher(object):
+    """
+    Matches the links of a given text around its link anchors. The anchors must be given in
+    increasing order: the end of the run of domain name characters of an anchor and the body of
+    the links ending this run are computed once and reused for the next anchors of the same run.
+    This way each character is scanned a bounded number of times, even if a long run contains a
+    lot of anchors that do not start any link.
+    """
+    def __init__(self, data):
+        self.data = data
+        self._anchor = self._domain_end = -1
+        self._domain_suffix_start = None
+        self._domain_body_end = False
+
+    def match(self, anchor, lower_bound=0):
+        """
+        Returns the (start, end) span of the leftmost link starting between the given lower bound
+        and the given link anchor, or None. A link can only start before its anchor if it is
+        separated from this anchor by domain name characters.
+        """
+        data = self.data
+        start = anchor
+        while start > lower_bound and _domain_char_re.match(data, start - 1):
+            start -= 1
+
+        # All the links starting with a domain name followed by a slash share the run of domain
+        # name characters of the anchor and thus the same body: this body is matched at most once
+        if not self._anchor <= anchor < self._domain_end:
+            domain_end = self._domain_end = _domain_chars_re.match(data, anchor).end()
+            self._domain_suffix_start = None
+            self._domain_body_end = False
+            if domain_end < len(data) and data[domain_end] == '/':
+                for suffix_start in range(domain_end - 3, max(domain_end - 6, -1), -1):
+                    if _domain_suffix_re.match(data, suffix_start):
+                        self._domain_suffix_start = suffix_start
+                        break
+        self._anchor = anchor
+        domain_suffix_start = self._domain_suffix_start
+
+        for link_start in range(start, anchor + 1):
+            if not _is_word_boundary(data, link_start):
+                continue
+            for prefix_re in (_scheme_re, _www_re):
+                prefix = prefix_re.match(data, link_start)
+                if prefix:
+                    end = _match_link_body(data, prefix.end())
+                    if end:
+                        return link_start, end
+            if domain_suffix_start is not None and link_start < domain_suffix_start:
+                if self._domain_body_end is False:
+                    self._domain_body_end = _match_link_body(data, self._domain_end + 1)
+                if self._domain_body_end:
+                    return link_start, self._domain_body_end
+
+
+def match_link(data, anchor, lower_bound=0):
+    """
+    Returns the (start, end) span of the leftmost link starting between the given lower bound and
+    the given link anchor, or None. A link can only start before its anchor if it is separated
+    from this anchor by domain name characters.
+    """
+    return LinkMatcher(data).match(anchor, lower_bound)
+
+
+def get_domain_run_end(data, pos):
+    """
+    Returns the end of the run of domain name characters that is split by the given position, or
+    this position itself if it does not split such a run.
+    """
+    if 0 < pos < len(data) and _domain_char_re.match(data, pos - 1) \
+            and _domain_char_re.match(data, pos):
+        return _domain_chars_re.match(data, pos).end()
+    return pos
+
+
+def find_links(data, pos=0):
+    """
+    Yields the (start, end) spans of the non-overlapping links of the given text, in the order
+    they appear. The spans are the ones of the matches of url_re.finditer.
+    """
+    link_matcher = LinkMatcher(data)
+    lower_bound = pos
+    anchor = _link_anchor_re.search(data, pos)
+    while anchor:
+        span = link_matcher.match(anchor.start(), lower_bound)
+        if span:
+            yield span
+            lower_bound = span[1]
+        else:
+            lower_bound = anchor.start() + 1
+        anchor = _link_anchor_re.search(data, lower_bound)
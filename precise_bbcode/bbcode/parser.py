@@ -1,9 +1,112 @@
+import hashlib
 import re
+import sys
+from array import array
 from collections import defaultdict
 
-from precise_bbcode.bbcode.regexes import url_re
+from django.core.exceptions import ImproperlyConfigured
+
+from precise_bbcode.bbcode.compiler import get_renderers
+from precise_bbcode.bbcode.compiler import uses_default_rendering
+from precise_bbcode.bbcode.defaults.placeholder import TextBBCodePlaceholder
+from precise_bbcode.bbcode.links import LINK_ANCHORS
+from precise_bbcode.bbcode.links import LinkMatcher
+from precise_bbcode.bbcode.links import get_domain_run_end
+from precise_bbcode.bbcode.regexes import bbcode_lexer_re
 from precise_bbcode.conf import settings as bbcode_settings
-from precise_bbcode.core.utils import replace
+from precise_bbcode.core.cache import BytesLRUCache
+
+
+# The kinds of the lexical tokens produced by the BBCodeParser lexer. Small integers are used so
+# that the parser loops can check the kind of each token with a cheap comparison.
+TK_START_TAG = 1
+TK_END_TAG = 2
+TK_DATA = 3
+TK_NEWLINE = 4
+
+# The options of the BBCode tags are flattened into bitmasks by the dispatch table of the parser,
+# so that the parser loops can check them with a bitwise operation instead of attribute lookups.
+OPT_NEWLINE_CLOSES = 1
+OPT_SAME_TAG_CLOSES = 2
+OPT_END_TAG_CLOSES = 4
+OPT_STANDALONE = 8
+OPT_RENDER_EMBEDDED = 16
+OPT_TRANSFORM_NEWLINES = 32
+OPT_ESCAPE_HTML = 64
+OPT_REPLACE_LINKS = 128
+OPT_STRIP = 256
+OPT_SWALLOW_TRAILING_NEWLINE = 512
+
+_OPTION_FLAGS = (
+    ('newline_closes', OPT_NEWLINE_CLOSES),
+    ('same_tag_closes', OPT_SAME_TAG_CLOSES),
+    ('end_tag_closes', OPT_END_TAG_CLOSES),
+    ('standalone', OPT_STANDALONE),
+    ('render_embedded', OPT_RENDER_EMBEDDED),
+    ('transform_newlines', OPT_TRANSFORM_NEWLINES),
+    ('escape_html', OPT_ESCAPE_HTML),
+    ('replace_links', OPT_REPLACE_LINKS),
+    ('strip', OPT_STRIP),
+    ('swallow_trailing_newline', OPT_SWALLOW_TRAILING_NEWLINE),
+)
+
+# The tags that can be closed by other tokens than their own end tag are not cached as subtrees
+_SUBTREE_CLOSING_FLAGS = OPT_NEWLINE_CLOSES | OPT_SAME_TAG_CLOSES | OPT_END_TAG_CLOSES
+
+# The minimum length of the source of the tag subtrees whose rendered output is cached: caching
+# the smaller subtrees costs more than rendering them
+SUBTREE_CACHE_MIN_LENGTH = 128
+
+# The tag subtrees are keyed by a polynomial hash of the hashes of their tokens: the key of any
+# subtree is computed in constant time from the prefix hashes of the token stream
+_SUBTREE_HASH_BASE = 1000003
+_SUBTREE_HASH_MODULUS = 2 ** 61 - 1
+
+
+# The content of a tag whose format relies on a default TEXT placeholder is valid if it contains at
+# least one word character
+_word_re = re.compile(r'\w', flags=re.U)
+
+_TOKEN_TYPE_NAMES = {
+    TK_START_TAG: 'start_tag',
+    TK_END_TAG: 'end_tag',
+    TK_DATA: 'data',
+    TK_NEWLINE: 'newline',
+}
+
+
+def _get_trie_pattern(node):
+    """
+    Given a node of a trie, returns a regex pattern matching the longest string stored in the
+    subtree of this node. The children of a node are dicts keyed by characters ; the nodes ending
+    a string are marked with an empty key.
+    """
+    alternatives = [
+        re.escape(char) + _get_trie_pattern(child)
+        for char, child in sorted(node.items()) if char]
+    if not alternatives:
+        return ''
+    pattern = alternatives[0] if len(alternatives) == 1 \
+        else '(?:{})'.format('|'.join(alternatives))
+    # The longer strings are tried first
+    return '(?:{})?'.format(pattern) if '' in node else pattern
+
+
+def _get_prefix_hashes(data, starts, ends):
+    """
+    Returns the prefix hashes of the tokens spanning data[starts[i]:ends[i]] and the powers of the
+    hash base. The hash of the tokens i to j (included) is given by the following expression:
+    (prefixes[j + 1] - prefixes[i] * powers[j + 1 - i]) % _SUBTREE_HASH_MODULUS.
+    """
+    prefixes, powers = array('q', [0]), array('q', [1])
+    prefix_hash, power = 0, 1
+    for start, end in zip(starts, ends):
+        prefix_hash = (prefix_hash * _SUBTREE_HASH_BASE + hash(data[start:end])) \
+            % _SUBTREE_HASH_MODULUS
+        power = power * _SUBTREE_HASH_BASE % _SUBTREE_HASH_MODULUS
+        prefixes.append(prefix_hash)
+        powers.append(power)
+    return prefixes, powers
 
 
 class BBCodeToken(object):
@@ -12,10 +115,14 @@ class BBCodeToken(object):
     class in order to turn a sequence of characters into a sequence of tokens that
     represents the ramifications of nested BBCode tags.
     """
-    TK_START_TAG = 'start_tag'
-    TK_END_TAG = 'end_tag'
-    TK_DATA = 'data'
-    TK_NEWLINE = 'newline'
+    # Tokens are created in large numbers: they don't embed a __dict__ in order to keep their
+    # memory footprint as small as possible
+    __slots__ = ('type', 'tag_name', 'option', 'text')
+
+    TK_START_TAG = TK_START_TAG
+    TK_END_TAG = TK_END_TAG
+    TK_DATA = TK_DATA
+    TK_NEWLINE = TK_NEWLINE
 
     def __init__(self, type, tag_name, option, text):
         self.type = type
@@ -25,33 +132,192 @@ class BBCodeToken(object):
 
     def __repr__(self):
         return '<BBCodeToken instance "({0}, {1}, {2}, {3})">'.format(
-            self.type, self.tag_name, self.option, self.text)
+            self.type_name, self.tag_name, self.option, self.text)
 
     def __str__(self):
         return 'BBCodeToken: ({0}, {1}, {2}, {3})'.format(
-            self.type, self.tag_name, self.option, self.text)
+            self.type_name, self.tag_name, self.option, self.text)
 
     __unicode__ = __str__
 
+    @property
+    def type_name(self):
+        return _TOKEN_TYPE_NAMES[self.type]
+
     @property
     def is_start_tag(self):
-        return self.type == self.TK_START_TAG
+        return self.type == TK_START_TAG
 
     @property
     def is_end_tag(self):
-        return self.type == self.TK_END_TAG
+        return self.type == TK_END_TAG
 
     @property
     def is_tag(self):
-        return self.is_start_tag or self.is_end_tag
+        return self.type == TK_START_TAG or self.type == TK_END_TAG
 
     @property
     def is_data(self):
-        return self.type == self.TK_DATA
+        return self.type == TK_DATA
 
     @property
     def is_newline(self):
-        return self.type == self.TK_NEWLINE
+        return self.type == TK_NEWLINE
+
+
+# Newline tokens do not carry any specific data: a single instance is shared by all the token
+# streams produced by the lexer
+_NEWLINE_TOKEN = BBCodeToken(TK_NEWLINE, None, None, '\n')
+
+
+class BBCodeTokenStream(object):
+    """
+    Represents a sequence of BBCode tokens produced by the lexer provided by the BBCodeParser
+    class. The tokens are not stored as BBCodeToken instances: their kinds and their boundaries
+    in the tokenized data are stored in parallel arrays, so that the text of a token is only
+    extracted from the source data when it is actually needed. The tags are interned: each tag
+    token references a (tag_name, option) pair of the 'tags' list through its tag identifier.
+
+    Once the tags of the stream have been paired, the 'closing_ends' and 'closing_consumed' arrays
+    give, for each start tag token, the index of its closing token and whether this closing token
+    should be consumed by the tag.
+    """
+
+    def __init__(self, data, kinds=None, starts=None, ends=None, tag_ids=None, tags=None):
+        self.data = data
+        self.kinds = array('b') if kinds is None else kinds
+        self.starts = array('l') if starts is None else starts
+        self.ends = array('l') if ends is None else ends
+        self.tag_ids = array('i') if tag_ids is None else tag_ids
+        self.tags = [] if tags is None else tags
+        self._tag_ids = {}
+        self.closing_ends = None
+        self.closing_consumed = None
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            # The slices of a token stream share the source data and the tags of the stream
+            return BBCodeTokenStream(
+                self.data, self.kinds[index], self.starts[index], self.ends[index],
+                self.tag_ids[index], self.tags)
+        kind = self.kinds[index]
+        if kind == TK_NEWLINE:
+            return _NEWLINE_TOKEN
+        elif kind == TK_DATA:
+            return BBCodeToken(TK_DATA, None, None, self.get_text(index))
+        tag_name, option = self.tags[self.tag_ids[index]]
+        return BBCodeToken(kind, tag_name, option, self.get_text(index))
+
+    def __iter__(self):
+        # The tokens associated with a given tag string are only created once
+        tag_tokens = {}
+        for index, kind in enumerate(self.kinds):
+            if kind == TK_START_TAG or kind == TK_END_TAG:
+                text = self.get_text(index)
+                token = tag_tokens.get(text)
+                if token is None:
+                    token = tag_tokens[text] = self[index]
+                yield token
+            else:
+                yield self[index]
+
+    def append(self, kind, start, end, tag_id=-1):
+        """
+        Appends a token of the given kind, spanning data[start:end], to the stream.
+        """
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.tag_ids.append(tag_id)
+
+    def get_tag_id(self, tag):
+        """
+        Returns the identifier of the given (tag_name, option) pair, registering it in the stream
+        if necessary.
+        """
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = self._tag_ids[tag] = len(self.tags)
+            self.tags.append(tag)
+        return tag_id
+
+    def get_tag_name(self, index):
+        return self.tags[self.tag_ids[index]][0]
+
+    def get_option(self, index):
+        return self.tags[self.tag_ids[index]][1]
+
+    def get_text(self, index):
+        return self.data[self.starts[index]:self.ends[index]]
+
+
+class BBCodeTagTable(object):
+    """
+    Represents the dispatch table built by the BBCodeParser class from its tags. This table is
+    immutable: it is built again whenever the tags of the parser change. Each tag name is
+    associated with a small integer identifier through the 'ids' dictionary. These identifiers
+    index the following tuples:
+
+        tags
+            The BBCodeTag instances.
+        flags
+            The options of the tags, flattened into bitmasks of OPT_* flags.
+        renderers
+            The bound 'do_render' methods of the tags, or the render functions generated for
+            them by the compiler if the tags are compiled.
+        raw_content_end_res
+            The regexes matching the closing tags of the tags whose content is raw text, or None.
+        wrapping_strings
+            The wrapping strings of the tags that only wrap their content, or None.
+        uses_parent
+            Booleans indicating whether the rendering of the tags can depend on their parent tag.
+    """
+    __slots__ = (
+        'ids', 'tags', 'flags', 'renderers', 'raw_content_end_res', 'wrapping_strings',
+        'uses_parent')
+
+    def __init__(
+            self, ids, tags, flags, renderers, raw_content_end_res, wrapping_strings,
+            uses_parent):
+        self.ids = ids
+        self.tags = tags
+        self.flags = flags
+        self.renderers = renderers
+        self.raw_content_end_res = raw_content_end_res
+        self.wrapping_strings = wrapping_strings
+        self.uses_parent = uses_parent
+
+
+class _RenderingFrame(object):
+    """
+    Represents an entry of the rendering stack of the BBCodeParser class: a tag whose content is
+    being rendered, the position of this content in the output and the rendering state of the
+    range enclosing this tag, which is restored once the content has been rendered.
+    """
+    __slots__ = (
+        'table_id', 'wrapping_strings', 'option', 'token_end', 'consume_now', 'content_start',
+        'newline_start', 'parent_tag', 'parent_flags', 'end', 'has_word', 'subtree_key',
+        'subtree_start')
+
+    def __init__(
+            self, table_id, wrapping_strings, option, token_end, consume_now, content_start,
+            newline_start, parent_tag, parent_flags, end, has_word, subtree_key, subtree_start):
+        self.table_id = table_id
+        self.wrapping_strings = wrapping_strings
+        self.option = option
+        self.token_end = token_end
+        self.consume_now = consume_now
+        self.content_start = content_start
+        self.newline_start = newline_start
+        self.parent_tag = parent_tag
+        self.parent_flags = parent_flags
+        self.end = end
+        self.has_word = has_word
+        self.subtree_key = subtree_key
+        self.subtree_start = subtree_start
 
 
 class BBCodeParser(object):
@@ -60,16 +326,46 @@ class BBCodeParser(object):
     _TAG_OPENING = '['
     _TAG_ENDING = ']'
 
+    # The lexer engines that can be used to tokenize BBCode contents
+    _LEXERS = ('regex', 'legacy')
+
     def __init__(self, *args, **kwargs):
         # Settings
         self.newline_char = bbcode_settings.BBCODE_NEWLINE
         self.replace_html = bbcode_settings.BBCODE_ESCAPE_HTML
         self.normalize_newlines = bbcode_settings.BBCODE_NORMALIZE_NEWLINES
+        self.lexer = bbcode_settings.BBCODE_LEXER
+        self.compile_tags = bbcode_settings.BBCODE_COMPILE_TAGS
+        if self.lexer not in self._LEXERS:
+            raise ImproperlyConfigured(
+                'The BBCODE_LEXER setting must be one of {!r}, {!r} is not valid'.format(
+                    self._LEXERS, self.lexer))
 
         # Initializes the placeholders, bbcodes and smilies stores
         self.placeholders = {}
         self.bbcodes = {}
         self.smilies = {}
+        # The smiley codes are stored in a trie, from which a regex matching the longest smiley code
+        # starting at any position is compiled when the smilies are replaced
+        self._smilies_trie = {}
+        self._smilies_re = None
+        # The regexes matching the link anchors and the smiley codes of the texts in a single scan,
+        # for each combination of the tag options
+        self._textual_res = {}
+        self._raw_content_tags = {}
+        self._wrapping_tags = {}
+        # The dispatch table of the tags, which is built lazily
+        self._tag_table = None
+        # The fingerprint of the configuration of the parser, which is computed lazily
+        self._fingerprint = None
+        # The rendered texts, which are cached if the BBCODE_RENDER_LRU_CACHE_BYTES setting is set
+        self.render_cache = BytesLRUCache(bbcode_settings.BBCODE_RENDER_LRU_CACHE_BYTES)
+        # The rendered tag subtrees, which are cached if the BBCODE_SUBTREE_CACHE_BYTES setting is
+        # set
+        self.subtree_cache = BytesLRUCache(bbcode_settings.BBCODE_SUBTREE_CACHE_BYTES)
+        # Indicates whether a smiley code or image contains a newline ; the textual transformations
+        # cannot be applied to several lines at once in this case
+        self._multiline_smilies = False
 
     def add_placeholder(self, placeholder_klass):
         """
@@ -84,6 +380,14 @@ class BBCodeParser(object):
                 The content used to fill the placeholder that must be validated.
         """
         self.placeholders[placeholder_klass.name.upper()] = placeholder_klass()
+        # The placeholders of the tags are bound to their validators when the tags are added: the
+        # tags that were added before the placeholder must be bound again
+        for tag in self.bbcodes.values():
+            tag._bind_placeholders(self.placeholders)
+        self._tag_table = None
+        self._fingerprint = None
+        self.render_cache.clear()
+        self.subtree_cache.clear()
 
     def add_bbcode_tag(self, tag_klass):
         """
@@ -102,7 +406,102 @@ class BBCodeParser(object):
                 The parent BBCodeTag instance, if the tag is being rendered inside another tag,
                 otherwise None.
         """
-        self.bbcodes[tag_klass.name] = tag_klass()
+        tag = self.bbcodes[tag_klass.name] = tag_klass()
+        tag._bind_placeholders(self.placeholders)
+        # The content of the tags that do not render their embedded content is not tokenized: the
+        # lexer directly jumps to the corresponding closing tag, which is found by using the
+        # following regex
+        if self._has_raw_content(tag):
+            self._raw_content_tags[tag.name] = re.compile(
+                r'\[[^\S\n\r]*/[^\S\n\r]*{}[^\S\n\r]*\]'.format(re.escape(tag.name)),
+                re.IGNORECASE)
+        else:
+            self._raw_content_tags.pop(tag.name, None)
+        # The tags that only wrap their content are rendered by emitting their prefix and their
+        # suffix around the rendered content
+        wrapping_strings = self._get_wrapping_strings(tag)
+        if wrapping_strings:
+            self._wrapping_tags[tag.name] = wrapping_strings
+        else:
+            self._wrapping_tags.pop(tag.name, None)
+        self._tag_table = None
+        self._fingerprint = None
+        self.render_cache.clear()
+        self.subtree_cache.clear()
+
+    def remove_bbcode_tag(self, tag_name):
+        """
+        Uninstalls the renderer of the specified tag and returns it. A KeyError is raised if the
+        tag is not installed. The tags of the parser should only be updated by using this method
+        and the 'add_bbcode_tag' method: the dispatch table of the parser is not built again
+        otherwise.
+        """
+        tag = self.bbcodes.pop(tag_name)
+        self._raw_content_tags.pop(tag_name, None)
+        self._wrapping_tags.pop(tag_name, None)
+        self._tag_table = None
+        self._fingerprint = None
+        self.render_cache.clear()
+        self.subtree_cache.clear()
+        return tag
+
+    def _get_tag_table(self):
+        """
+        Returns the dispatch table of the tags of the parser, building it if necessary.
+        """
+        if self._tag_table is None:
+            tag_names = sorted(self.bbcodes)
+            tags = tuple(self.bbcodes[tag_name] for tag_name in tag_names)
+            # The wrapping tags rely on the validation performed by the default TEXT placeholder
+            wrapping_tags = self._wrapping_tags \
+                if type(self.placeholders.get('TEXT')) is TextBBCodePlaceholder else {}
+            self._tag_table = BBCodeTagTable(
+                ids=dict((tag_name, tag_id) for tag_id, tag_name in enumerate(tag_names)),
+                tags=tags,
+                flags=tuple(
+                    sum(flag for option, flag in _OPTION_FLAGS if getattr(tag._options, option))
+                    for tag in tags),
+                renderers=get_renderers(tags) if self.compile_tags else tuple(
+                    tag.do_render for tag in tags),
+                raw_content_end_res=tuple(
+                    self._raw_content_tags.get(tag_name) for tag_name in tag_names),
+                wrapping_strings=tuple(wrapping_tags.get(tag_name) for tag_name in tag_names),
+                uses_parent=tuple(not uses_default_rendering(tag) for tag in tags))
+        return self._tag_table
+
+    def _has_raw_content(self, tag):
+        """
+        Returns True if the content of the given tag can be considered as raw text by the lexer,
+        that is if the embedded tags are not rendered and if the tag can only be closed by its
+        own ending tag.
+        """
+        options = tag._options
+        return not (
+            options.render_embedded or options.standalone or options.newline_closes or
+            options.same_tag_closes or options.end_tag_closes)
+
+    def _get_wrapping_strings(self, tag):
+        """
+        Returns a 4-tuple of the form (prefix, suffix, invalid_prefix, invalid_suffix) if the
+        given tag only wraps its rendered content in a prefix and a suffix, that is if it is
+        defined by a definition string and a format string using a single TEXT placeholder.
+        The invalid prefix and suffix are the parts of the definition string that are output
+        instead if the content of the tag is not valid. None is returned for any other tag.
+        """
+        if tag._options.standalone or not tag._options.render_embedded \
+                or not uses_default_rendering(tag):
+            return
+        render_plan = tag._render_plan
+        content_placeholder = render_plan.content_placeholder
+        if content_placeholder is None or render_plan.option_placeholder \
+                or render_plan.placeholder_contexts[content_placeholder] != ('TEXT', '') \
+                or len(render_plan.format_placeholders) != 1 \
+                or tag.definition_string.count('{') != 1 or tag.definition_string.count('}') != 1:
+            return
+        wrapping_strings = tuple(render_plan.format_parts + render_plan.definition_parts)
+        if any('\n' in string for string in wrapping_strings):
+            return
+        return wrapping_strings
 
     def add_smiley(self, code, img):
         """
@@ -110,6 +509,42 @@ class BBCodeParser(object):
         available smilies.
         """
         self.smilies[code] = img
+        if code:
+            node = self._smilies_trie
+            for char in code:
+                node = node.setdefault(char, {})
+            node[''] = True
+            self._smilies_re = None
+            self._textual_res.clear()
+        if '\n' in code or '\n' in img:
+            self._multiline_smilies = True
+        self._fingerprint = None
+        self.render_cache.clear()
+        self.subtree_cache.clear()
+
+    def get_fingerprint(self):
+        """
+        Returns a hash of everything the output of the parser depends on: its tags, its
+        placeholders, its smilies and its settings. Two parsers having the same fingerprint render
+        any text in the same way, provided that the code of their tags and placeholders is the
+        same.
+        """
+        if self._fingerprint is None:
+            tag_table = self._get_tag_table()
+            configuration = repr((
+                [
+                    (tag.name, _get_klass_path(tag), tag.definition_string, tag.format_string,
+                     tag_flags)
+                    for tag, tag_flags in zip(tag_table.tags, tag_table.flags)],
+                [
+                    (name, _get_klass_path(placeholder),
+                     placeholder.pattern.pattern if placeholder.pattern else None)
+                    for name, placeholder in sorted(self.placeholders.items())],
+                sorted(self.smilies.items()),
+                (self.newline_char, self.replace_html, self.normalize_newlines),
+            ))
+            self._fingerprint = hashlib.sha1(configuration.encode('utf-8')).hexdigest()
+        return self._fingerprint
 
     def _parse_tag(self, tag):
         """
@@ -155,11 +590,136 @@ class BBCodeParser(object):
             Token text
                 The original text of the token
         """
-        tokens = []
-        pos = tag_start = tag_end = 0
+        return list(self.iter_tokens(data))
+
+    def iter_tokens(self, data):
+        """
+        Given an input text, lazily yields the tokens returned by the get_tokens method. The input
+        text is only tokenized as the tokens are consumed: this allows to stop early (eg. to build
+        an excerpt or to count the tags of a text) without lexing the rest of a large text.
+        """
+        data = self._normalize(data)
+        # The tokens associated with a given tag string are only created once
+        tag_tokens = {}
+        for kind, start, end, tag in self._iter_lexical_units(data):
+            if kind == TK_NEWLINE:
+                yield _NEWLINE_TOKEN
+            elif kind == TK_DATA:
+                yield BBCodeToken(TK_DATA, None, None, data[start:end])
+            else:
+                text = data[start:end]
+                token = tag_tokens.get(text)
+                if token is None:
+                    token = tag_tokens[text] = BBCodeToken(kind, tag[0], tag[1], text)
+                yield token
+
+    def get_token_stream(self, data):
+        """
+        Given an input text, returns a BBCodeTokenStream instance embedding the tokens of this
+        text. The text of each token is not copied: the stream only stores the boundaries of the
+        tokens in the (normalized) input text.
+        """
+        return self._build_token_stream(self._normalize(data))
 
+    def _build_token_stream(self, data):
+        stream = BBCodeTokenStream(data)
+        append, get_tag_id = stream.append, stream.get_tag_id
+        for kind, start, end, tag in self._iter_lexical_units(data):
+            append(kind, start, end, -1 if tag is None else get_tag_id(tag))
+        return stream
+
+    def _normalize(self, data):
         if self.normalize_newlines:
             data = data.replace('\r\n', '\n').replace('\r', '\n')
+        return data
+
+    def _iter_lexical_units(self, data):
+        """
+        Given a normalized input text, lazily yields its lexical units as 4-tuples of the form:
+            (kind, start, end, tag)
+        where 'start' and 'end' are the boundaries of the unit in the input text and 'tag' is a
+        (tag_name, option) pair for tag units, otherwise None.
+        """
+        if self.lexer == 'legacy':
+            return self._iter_lexical_units_legacy(data)
+        return self._iter_lexical_units_regex(data)
+
+    def _iter_lexical_units_regex(self, data):
+        """
+        Tokenizes the given data by using a single precompiled scanner regex. Each match of this
+        regex corresponds to a lexical unit (newline, text run, tag, ...), which allows the whole
+        content to be tokenized in one left-to-right pass.
+        """
+        tag_table = self._get_tag_table()
+        table_ids, raw_content_end_res = tag_table.ids, tag_table.raw_content_end_res
+        match_unit = bbcode_lexer_re.match
+        # Tags are usually repeated many times in a given text: each tag string is only analyzed
+        # once and is associated with a (kind, tag, raw_content_end_re) tuple
+        tags = {}
+        # The last closing tags found for the tags whose content is raw text
+        raw_content_ends = {}
+        # The position of the next closing bracket is used to detect the opening brackets that are
+        # not followed by any closing bracket: the remaining data is tokenized as text in this case
+        next_tag_ending = -1
+        pos = 0
+
+        while pos < len(data):
+            match = match_unit(data, pos)
+            unit = match.lastgroup
+            start, pos = match.span()
+            if unit == 'newline':
+                yield TK_NEWLINE, start, pos, None
+            elif unit == 'text':
+                yield TK_DATA, start, pos, None
+            elif unit == 'tag':
+                text = match.group()
+                tag_unit = tags.get(text)
+                if tag_unit is None:
+                    end_name, start_name = match.group('end_name', 'start_name')
+                    # The fetched tag must be known by the parser to be tokenized as a BBCode tag ;
+                    # otherwise it will be tokenized as data
+                    if end_name is not None and end_name.lower() in table_ids:
+                        tag_unit = (TK_END_TAG, (end_name.lower(), None), None)
+                    elif start_name is not None and start_name.lower() in table_ids:
+                        option = match.group('option')
+                        tag_name = start_name.lower()
+                        tag_unit = (
+                            TK_START_TAG,
+                            (tag_name, option.rstrip() if option is not None else None),
+                            raw_content_end_res[table_ids[tag_name]])
+                    else:
+                        tag_unit = (TK_DATA, None, None)
+                    tags[text] = tag_unit
+                kind, tag, raw_content_end_re = tag_unit
+                yield kind, start, pos, tag
+                if raw_content_end_re is not None:
+                    raw_content_end = self._search_raw_content_end(
+                        data, pos, raw_content_end_re, raw_content_ends)
+                    if raw_content_end is not None:
+                        yield from self._iter_raw_content_units(data, tag[0], pos, raw_content_end)
+                        pos = raw_content_end.end()
+            elif unit == 'bracketed':
+                yield from self._iter_textual_units(data, start, pos)
+            else:
+                if start > next_tag_ending:
+                    next_tag_ending = data.find(self._TAG_ENDING, start)
+                    if next_tag_ending < 0:
+                        # An umatched [
+                        yield from self._iter_textual_units(data, start, len(data))
+                        break
+                yield TK_DATA, start, pos, None
+
+    def _iter_lexical_units_legacy(self, data):
+        """
+        Tokenizes the given data by successively searching the opening and ending characters of
+        the tags.
+        """
+        tag_table = self._get_tag_table()
+        pos = tag_start = new_tag_start = 0
+        tag_end = -1
+        # The last closing tags found for the tags whose content is raw text
+        raw_content_ends = {}
+
         while pos < len(data):
             # Search a new tag from the current position
             tag_start = data.find(self._TAG_OPENING, pos)
@@ -169,252 +729,681 @@ class BBCodeParser(object):
                 # There can be data between the index of the current tag opening character and the
                 # previous position. These textual data are tokenised
                 if pos_diff:
-                    tokens.extend(self._get_textual_tokens(data[pos:tag_start]))
+                    yield from self._iter_textual_units(data, pos, tag_start)
 
-                # Try to find the apparent end of the current tag
-                tag_end = data.find(self._TAG_ENDING, tag_start)
-                # Is a new tag starting from here?
-                new_tag_start = data.find(self._TAG_OPENING, tag_start + len(self._TAG_OPENING))
+                # Try to find the apparent end of the current tag and check whether a new tag is
+                # starting from here. The positions found for a previous opening character are
+                # reused as long as they are located after the current one: this way each character
+                # is inspected a bounded number of times, even if the data contains a lot of
+                # unmatched opening or ending characters
+                if tag_end < tag_start:
+                    tag_end = data.find(self._TAG_ENDING, tag_start)
+                if new_tag_start <= tag_start:
+                    new_tag_start = data.find(
+                        self._TAG_OPENING, tag_start + len(self._TAG_OPENING))
 
                 if new_tag_start > 0 and new_tag_start < tag_end:
                     # In this case, a new opening character has been found ; the previous ones will
                     # be tokenized as data.
-                    tokens.extend(self._get_textual_tokens(data[tag_start:new_tag_start]))
+                    yield from self._iter_textual_units(data, tag_start, new_tag_start)
                     pos = new_tag_start
                 elif tag_end > tag_start:
-                    tag = data[tag_start:tag_end + len(self._TAG_ENDING)]
-                    valid, tag_name, closing, option = self._parse_tag(tag)
+                    pos = tag_end + len(self._TAG_ENDING)
+                    valid, tag_name, closing, option = self._parse_tag(data[tag_start:pos])
                     # The fetched tag must be known by the parser to be tokenized as a BBCode tag ;
                     # otherwise it will be tokenized as data
-                    if valid and tag_name in self.bbcodes:
-                        if closing:
-                            tokens.append(BBCodeToken(BBCodeToken.TK_END_TAG, tag_name, None, tag))
-                        else:
-                            tokens.append(
-                                BBCodeToken(BBCodeToken.TK_START_TAG, tag_name, option, tag))
+                    if valid and tag_name in tag_table.ids:
+                        yield (
+                            TK_END_TAG if closing else TK_START_TAG, tag_start, pos,
+                            (tag_name, option))
+                        raw_content_end_re = None if closing else \
+                            tag_table.raw_content_end_res[tag_table.ids[tag_name]]
+                        raw_content_end = self._search_raw_content_end(
+                            data, pos, raw_content_end_re, raw_content_ends) \
+                            if raw_content_end_re is not None else None
+                        if raw_content_end is not None:
+                            yield from self._iter_raw_content_units(
+                                data, tag_name, pos, raw_content_end)
+                            pos = raw_content_end.end()
                     else:
-                        tokens.extend(self._get_textual_tokens(tag))
-                    pos = tag_end + len(self._TAG_ENDING)
+                        yield from self._iter_textual_units(data, tag_start, pos)
                 else:
-                    # An umatched [
+                    # An umatched [ ; the remaining data (including this character) will be
+                    # tokenized as data
+                    pos = tag_start
                     break
             else:
                 break
         # Tokenize the remaining data if a break occured
         if pos < len(data):
-            tokens.extend(self._get_textual_tokens(data[pos:]))
-        return tokens
+            yield from self._iter_textual_units(data, pos, len(data))
 
-    def _get_textual_tokens(self, data):
+    def _search_raw_content_end(self, data, pos, raw_content_end_re, raw_content_ends):
         """
-        Given a list of textual data, returns a list of TK_NEWLINE or TK_DATA tokens.
+        Returns the match of the first closing tag found by the given regex after the given
+        position, or None. The last match of each regex is stored in the 'raw_content_ends' dict
+        and reused as long as it is located after the current position ; a missing closing tag is
+        also remembered. This way the data is searched at most once for each regex, even if it
+        contains a lot of unclosed tags whose content is raw text.
         """
-        token_types = []
-        token_types = defaultdict(lambda: BBCodeToken.TK_DATA, token_types)
-        token_types['\n'] = BBCodeToken.TK_NEWLINE
-        tokens = []
+        raw_content_end = raw_content_ends.get(raw_content_end_re, False)
+        if raw_content_end is False \
+                or (raw_content_end is not None and raw_content_end.start() < pos):
+            raw_content_end = raw_content_ends[raw_content_end_re] = \
+                raw_content_end_re.search(data, pos)
+        return raw_content_end
 
-        data = re.split('(\n)', data)
-        for value in data:
-            if value:
-                tokens.append(BBCodeToken(token_types[value], None, None, value))
-        return tokens
+    def _iter_raw_content_units(self, data, tag_name, start, end_match):
+        """
+        Given the start position of the content of a tag whose content is raw text and the match
+        of the corresponding closing tag, yields a single TK_DATA unit for the whole content
+        (if it is not empty) followed by the TK_END_TAG unit of the closing tag.
+        """
+        if end_match.start() > start:
+            yield TK_DATA, start, end_match.start(), None
+        yield TK_END_TAG, end_match.start(), end_match.end(), (tag_name, None)
+
+    def _iter_textual_units(self, data, start, end):
+        """
+        Given the boundaries of textual data in the given input text, yields the corresponding
+        TK_NEWLINE or TK_DATA lexical units.
+        """
+        newline_pos = data.find('\n', start, end)
+        while newline_pos >= 0:
+            if newline_pos > start:
+                yield TK_DATA, start, newline_pos, None
+            yield TK_NEWLINE, newline_pos, newline_pos + 1, None
+            start = newline_pos + 1
+            newline_pos = data.find('\n', start, end)
+        if start < end:
+            yield TK_DATA, start, end, None
 
     def _drop_syntactic_errors(self, tokens):
         """
-        Given a list of lexical tokens, find the tags that are not closed or not started
+        Given a stream of lexical tokens, find the tags that are not closed or not started
         and converts them to textual tokens. The non-valid tokens must not be swallowed.
         The tag tokens that are not valid in the BBCode tree will be converted to textual tokens
         (eg. in '[b][i]test[/b][/i]'the 'b' tags will be tokenized as data).
         """
+        kinds, tag_ids, tags = tokens.kinds, tokens.tag_ids, tokens.tags
+        # The option flags of the tags are fetched once for each tag of the stream
+        tag_table = self._get_tag_table()
+        tags_flags = [tag_table.flags[tag_table.ids[tag_name]] for tag_name, _ in tags]
+        # The opening tags stack contains (tag_name, index, tag_flags) tuples. The number of
+        # occurrences of each tag name in this stack is maintained alongside, so that checking
+        # whether a tag is currently opened does not depend on the nesting depth
         opening_tags = []
-        for index, token in enumerate(tokens):
-            if token.is_start_tag:
-                tag_options = self.bbcodes[token.tag_name]._options
-                if tag_options.same_tag_closes and len(opening_tags) > 0 \
-                        and opening_tags[-1][0].tag_name == token.tag_name:
-                    opening_tags.pop()
-                if not tag_options.standalone:
-                    opening_tags.append((token, index))
-            elif token.is_end_tag:
-                tag_options = self.bbcodes[token.tag_name]._options
+        opened_tags_count = defaultdict(int)
+
+        def pop_opening_tag():
+            tag_name, index, _ = opening_tags.pop()
+            opened_tags_count[tag_name] -= 1
+            return tag_name, index
+
+        for index, token_type in enumerate(kinds):
+            if token_type == TK_START_TAG:
+                tag_id = tag_ids[index]
+                tag_name, tag_flags = tags[tag_id][0], tags_flags[tag_id]
+                if tag_flags & OPT_SAME_TAG_CLOSES and len(opening_tags) > 0 \
+                        and opening_tags[-1][0] == tag_name:
+                    pop_opening_tag()
+                if not (tag_flags & OPT_STANDALONE):
+                    opening_tags.append((tag_name, index, tag_flags))
+                    opened_tags_count[tag_name] += 1
+            elif token_type == TK_END_TAG:
+                tag_id = tag_ids[index]
+                tag_name, tag_flags = tags[tag_id][0], tags_flags[tag_id]
                 if len(opening_tags) > 0:
-                    previous_tag, _ = opening_tags[-1]
-                    previous_tag_options = self.bbcodes[previous_tag.tag_name]._options
-                    if previous_tag_options.end_tag_closes:
-                        opening_tags.pop()
+                    if opening_tags[-1][2] & OPT_END_TAG_CLOSES:
+                        pop_opening_tag()
 
                     if not opening_tags:
                         continue
 
-                    if (opening_tags[-1][0].tag_name != token.tag_name and
-                       token.tag_name in [x[0].tag_name for x in opening_tags] and
-                       tag_options.render_embedded):
+                    if (opening_tags[-1][0] != tag_name and
+                       opened_tags_count[tag_name] > 0 and
+                       tag_flags & OPT_RENDER_EMBEDDED):
                         # In this case, we iterate to the first opening of the current tag : all the
                         # tags between the current tag and its opening are converted to textual
                         # tokens
-                        for tag in reversed(opening_tags):
-                            tk, index = tag
-                            if tk.tag_name == token.tag_name:
-                                opening_tags.pop()
+                        while True:
+                            opening_tag_name, opening_index = pop_opening_tag()
+                            if opening_tag_name == tag_name:
                                 break
-                            else:
-                                tokens[index] = BBCodeToken(
-                                    BBCodeToken.TK_DATA, None, None, tk.text)
-                                opening_tags.pop()
-                    elif opening_tags[-1][0].tag_name != token.tag_name:
-                        tokens[index] = BBCodeToken(BBCodeToken.TK_DATA, None, None, token.text)
+                            kinds[opening_index] = TK_DATA
+                    elif opening_tags[-1][0] != tag_name:
+                        kinds[index] = TK_DATA
                     else:
-                        opening_tags.pop()
+                        pop_opening_tag()
                 else:
-                    tokens[index] = BBCodeToken(BBCodeToken.TK_DATA, None, None, token.text)
-            elif token.is_newline:
-                if len(opening_tags) > 0:
-                    previous_tag, _ = opening_tags[-1]
-                else:
-                    previous_tag = None
-                if previous_tag:
-                    previous_tag_options = self.bbcodes[previous_tag.tag_name]._options
-                    if previous_tag_options.newline_closes:
-                        opening_tags.pop()
+                    kinds[index] = TK_DATA
+            elif token_type == TK_NEWLINE:
+                if len(opening_tags) > 0 and opening_tags[-1][2] & OPT_NEWLINE_CLOSES:
+                    pop_opening_tag()
         # The remaining tags do not have a closing tag, they must be converted to testual tokens)
-        for tag in opening_tags:
-            token, index = tag
-            tokens[index] = BBCodeToken(BBCodeToken.TK_DATA, None, None, token.text)
+        for _, index, _ in opening_tags:
+            kinds[index] = TK_DATA
+        # The valid tags can now be paired with their closing tokens
+        self._pair_tags(tokens)
+        return tokens
+
+    def _pair_tags(self, tokens):
+        """
+        Given a stream of lexical tokens whose syntactic errors have been dropped, find the
+        position of the closing token associated with each non-standalone start tag in a single
+        pass. These positions are stored in the 'closing_ends' array of the stream while the
+        'closing_consumed' array indicates whether each of these closing tokens should be consumed
+        or not. A start tag without closing token is associated with the end of the stream.
+        """
+        kinds, tag_ids, tags = tokens.kinds, tokens.tag_ids, tokens.tags
+        closing_ends = array('l', [len(kinds)]) * len(kinds)
+        closing_consumed = array('b', [True]) * len(kinds)
+        tag_table = self._get_tag_table()
+        tags_flags = [tag_table.flags[tag_table.ids[tag_name]] for tag_name, _ in tags]
+        # The start tags that are still waiting for their closing token are stored by tag name.
+        # The names of the tags that can be closed by a newline are tracked separately so that
+        # newlines do not have to go through all the pending tags
+        pending_tags = defaultdict(list)
+        pending_newline_closes_tags = set()
+
+        def close_pending_tags(tag_name, index, consume=True):
+            for start_index in pending_tags[tag_name]:
+                closing_ends[start_index] = index
+                closing_consumed[start_index] = consume
+            del pending_tags[tag_name][:]
+
+        for index, token_type in enumerate(kinds):
+            if token_type == TK_START_TAG:
+                tag_id = tag_ids[index]
+                tag_name, tag_flags = tags[tag_id][0], tags_flags[tag_id]
+                if tag_flags & OPT_STANDALONE:
+                    continue
+                if tag_flags & OPT_SAME_TAG_CLOSES:
+                    close_pending_tags(tag_name, index, consume=False)
+                pending_tags[tag_name].append(index)
+                if tag_flags & OPT_NEWLINE_CLOSES:
+                    pending_newline_closes_tags.add(tag_name)
+            elif token_type == TK_END_TAG:
+                tag_id = tag_ids[index]
+                tag_name, tag_flags = tags[tag_id][0], tags_flags[tag_id]
+                if not pending_tags[tag_name]:
+                    continue
+                if tag_flags & OPT_RENDER_EMBEDDED and not (tag_flags & OPT_SAME_TAG_CLOSES):
+                    # The similar tags embedded in the considered tag are closed first
+                    closing_ends[pending_tags[tag_name].pop()] = index
+                else:
+                    close_pending_tags(tag_name, index)
+            elif token_type == TK_NEWLINE and pending_newline_closes_tags:
+                for tag_name in pending_newline_closes_tags:
+                    close_pending_tags(tag_name, index)
+                pending_newline_closes_tags.clear()
+
+        tokens.closing_ends, tokens.closing_consumed = closing_ends, closing_consumed
         return tokens
 
     def _print_lexical_token_stream(self, data):  # pragma: no cover
         """
         Given an input text, print out the lexical token stream.
         """
-        tokens = self._drop_syntactic_errors(self.get_tokens(data))
+        tokens = self._drop_syntactic_errors(self.get_token_stream(data))
         for tk in tokens:
+            type_name = tk.type_name.upper()
             if tk.is_tag:
                 if tk.option:
-                    print(tk.type.upper() + " " + tk.tag_name + ", option = \"" + tk.option + "\"")
+                    print(type_name + " " + tk.tag_name + ", option = \"" + tk.option + "\"")
                 else:
-                    print(tk.type.upper() + " " + tk.tag_name)
+                    print(type_name + " " + tk.tag_name)
             elif tk.is_data:
-                print(tk.type.upper() + " \"" + tk.text + "\"")
+                print(type_name + " \"" + tk.text + "\"")
             elif tk.is_newline:
-                print(tk.type.upper())
-
-    def _find_closing_token(self, tag, tokens, pos):
-        """
-        Given a BBCodeTag tag instance, a list of lexical tokens and the position of the
-        current tag in this list, find the position of the associated closing tag. This
-        function returns a tuple of the form (end_pos, consume_now), where 'consume_now'
-        is a boolean that indicates whether the ending token should be consumed or not.
-        """
-        similar_tags_embedded = 0
-        while pos < len(tokens):
-            token = tokens[pos]
-            if token.is_newline and tag._options.newline_closes:
-                return pos, True
-            elif token.is_start_tag and token.tag_name == tag.name:
-                if tag._options.same_tag_closes:
-                    return pos, False
-                if tag._options.render_embedded:
-                    similar_tags_embedded += 1
-            elif token.is_end_tag and token.tag_name == tag.name:
-                if similar_tags_embedded > 0:
-                    similar_tags_embedded -= 1
-                else:
-                    return pos, True
-            pos += 1
-        return pos, True
+                print(type_name)
 
-    def _render_tokens(self, tokens, parent_tag=None):
+    def _render_tokens(self, tokens, parent_tag=None, start=0, end=None):
         """
-        Given a list of lexical tokens, do the rendering process. During this process, some
-        semantic verifications are done on this lexical token stream.
+        Given a stream of lexical tokens, do the rendering process. During this process, some
+        semantic verifications are done on this lexical token stream. Only the tokens whose
+        indexes are in the [start, end) range are rendered: the content of the tags is rendered
+        by working on sub-ranges of the same stream instead of copying its tokens.
+        The rendering is iterative: before rendering the content of a tag, the state of the
+        enclosing range is pushed onto an explicit stack. This state is restored once the content
+        has been rendered, so that deeply nested tags cannot exhaust the Python call stack.
+        All the rendered pieces are written to a single output list. The tags that only wrap their
+        content emit their prefix and their suffix around the pieces of their content while the
+        other tags are rendered from their joined content.
         """
-        itk = 0
-        rendered = []
-        while itk < len(tokens):
-            # Fetch the considered token
-            token = tokens[itk]
-
-            # Try to render it according to its type
-            if token.is_start_tag:
-                # Fetch some data about the current tag
-                call_rendering_function = self.bbcodes[token.tag_name].do_render
-                tag = self.bbcodes[token.tag_name]
-
-                if tag._options.standalone:
-                    rendered.append(call_rendering_function(self, None, token.option, parent_tag))
+        kinds, tag_ids, tags = tokens.kinds, tokens.tag_ids, tokens.tags
+        data, starts, ends = tokens.data, tokens.starts, tokens.ends
+        closing_ends, closing_consumed = tokens.closing_ends, tokens.closing_consumed
+        end = len(kinds) if end is None else end
+        itk = start
+        # The tags of the stream are mapped to the identifiers of the dispatch table once
+        tag_table = self._get_tag_table()
+        table_tags, tags_flags, renderers, wrapping_tags = \
+            tag_table.tags, tag_table.flags, tag_table.renderers, tag_table.wrapping_strings
+        table_ids = [tag_table.ids[tag_name] for tag_name, _ in tags]
+        subtree_cache = self.subtree_cache
+        # The prefix hashes of the tokens are only computed if a subtree can be cached ; only the
+        # outermost cacheable subtrees are stored in the cache
+        prefix_hashes = hash_powers = None
+        is_storing_subtree = False
+        parent_flags = None if parent_tag is None else tags_flags[tag_table.ids[parent_tag.name]]
+        output = []
+        # The indexes of the output pieces that contain newlines
+        newline_pieces = []
+        # Indicates whether the pieces of the current range contain word characters
+        has_word = False
+        # Each entry of this stack is a _RenderingFrame describing the tag whose content is being
+        # rendered
+        rendering_stack = []
+
+        def append(piece):
+            """
+            Appends the given piece to the output and returns True if it contains word characters.
+            """
+            if '\n' in piece:
+                newline_pieces.append(len(output))
+            output.append(piece)
+            return _word_re.search(piece) is not None
+
+        while True:
+            if itk < end:
+                # Fetch the type of the considered token
+                token_type = kinds[itk]
+                itk += 1
+
+                # Try to render it according to its type
+                if token_type == TK_START_TAG:
+                    # Fetch some data about the current tag
+                    tag_id = tag_ids[itk - 1]
+                    option = tags[tag_id][1]
+                    table_id = table_ids[tag_id]
+                    tag, tag_flags = table_tags[table_id], tags_flags[table_id]
+
+                    if tag_flags & OPT_STANDALONE:
+                        has_word = append(renderers[table_id](self, None, option, parent_tag)) \
+                            or has_word
+                        continue
+
+                    # First fetch the closing tag associated with this tag ; a tag that is not
+                    # closed before the end of the current range is closed by this end
+                    token_end, consume_now = closing_ends[itk - 1], closing_consumed[itk - 1]
+                    if token_end >= end:
+                        token_end, consume_now = end, True
+
+                    if tag_flags & OPT_RENDER_EMBEDDED:
+                        # The tags that are explicitly closed by their own end tag are rendered
+                        # in the same way wherever their source appears: their rendered output
+                        # can be fetched from the subtree cache, keyed by a hash of this source
+                        # and by their parent tag if their rendering depends on it
+                        subtree_key = None
+                        if subtree_cache.maxbytes and token_end < end and consume_now \
+                                and kinds[token_end] == TK_END_TAG \
+                                and not tag_flags & _SUBTREE_CLOSING_FLAGS \
+                                and ends[token_end] - starts[itk - 1] >= SUBTREE_CACHE_MIN_LENGTH:
+                            if prefix_hashes is None:
+                                prefix_hashes, hash_powers = _get_prefix_hashes(data, starts, ends)
+                            subtree_key = (
+                                tag_table.ids[parent_tag.name]
+                                if parent_tag is not None and tag_table.uses_parent[table_id]
+                                else -1,
+                                ends[token_end] - starts[itk - 1],
+                                (prefix_hashes[token_end + 1] - prefix_hashes[itk - 1] *
+                                 hash_powers[token_end + 2 - itk]) % _SUBTREE_HASH_MODULUS)
+                            cached_subtree = subtree_cache.get(subtree_key)
+                            # The source of the cached subtree is compared to the current source
+                            # in case of hash collision
+                            if cached_subtree is not None \
+                                    and data.startswith(cached_subtree[0], starts[itk - 1]):
+                                _, pieces, newline_offsets, subtree_has_word = cached_subtree
+                                newline_pieces.extend(
+                                    len(output) + offset for offset in newline_offsets)
+                                output.extend(pieces)
+                                has_word = subtree_has_word or has_word
+                                itk = token_end + 1
+                                # The trailing newline is swallowed as if the tag was rendered
+                                if tag_flags & OPT_SWALLOW_TRAILING_NEWLINE \
+                                        and itk < end and kinds[itk] == TK_NEWLINE:
+                                    itk += 1
+                                continue
+                            if is_storing_subtree:
+                                # This subtree is stored with the enclosing one
+                                subtree_key = None
+                            else:
+                                is_storing_subtree = True
+
+                        # The embedded tokens are rendered first, in their own range
+                        wrapping_strings = wrapping_tags[table_id]
+                        subtree_start = len(output)
+                        if wrapping_strings:
+                            append(wrapping_strings[0])
+                        rendering_stack.append(_RenderingFrame(
+                            table_id=table_id, wrapping_strings=wrapping_strings, option=option,
+                            token_end=token_end, consume_now=consume_now,
+                            content_start=len(output), newline_start=len(newline_pieces),
+                            parent_tag=parent_tag, parent_flags=parent_flags, end=end,
+                            has_word=has_word, subtree_key=subtree_key,
+                            subtree_start=subtree_start))
+                        parent_tag, parent_flags, end, has_word = tag, tag_flags, token_end, False
+                        continue
+
+                    # The embedded tokens are contiguous in the source data: their text can be
+                    # extracted all at once
+                    inner = self._render_textual_content(
+                        data[ends[itk - 1]:ends[token_end - 1]],
+                        bool(tag_flags & OPT_ESCAPE_HTML), bool(tag_flags & OPT_REPLACE_LINKS),
+                        bool(tag_flags & OPT_RENDER_EMBEDDED))
+                    has_word = append(self._render_tag(
+                        renderers[table_id], tag_flags, inner, option, parent_tag)) or has_word
+                elif token_type == TK_DATA or token_type == TK_NEWLINE:
+                    # The adjacent textual tokens share the same context: they are rendered at once
+                    run_start = itk - 1
+                    while itk < end and (kinds[itk] == TK_DATA or kinds[itk] == TK_NEWLINE):
+                        itk += 1
+                    has_word = append(
+                        self._render_textual_tokens(tokens, run_start, itk, parent_flags)) \
+                        or has_word
+                    continue
                 else:
-                    # First find the closing tag associated with this tag
-                    token_end, consume_now = self._find_closing_token(tag, tokens, itk + 1)
-                    embedded_tokens = tokens[itk + 1:token_end]
+                    continue
+            elif rendering_stack:
+                # The content of the current tag has been rendered: the tag itself can now be
+                # rendered in the enclosing range
+                frame = rendering_stack.pop()
+                token_end, consume_now = frame.token_end, frame.consume_now
+                parent_tag, parent_flags, end = frame.parent_tag, frame.parent_flags, frame.end
+                content_start, newline_start = frame.content_start, frame.newline_start
+                tag_flags = tags_flags[frame.table_id]
+                if frame.wrapping_strings:
+                    has_word = self._wrap_content(
+                        tag_flags, frame.wrapping_strings, frame.option, output, content_start,
+                        newline_pieces, newline_start, has_word)
+                else:
+                    # The content is stripped and its newlines are replaced piece by piece before
+                    # being joined
+                    self._strip_and_transform_pieces(
+                        tag_flags, output, content_start, newline_pieces, newline_start)
+                    inner = ''.join(output[content_start:])
+                    del output[content_start:]
+                    del newline_pieces[newline_start:]
+                    has_word = append(
+                        renderers[frame.table_id](self, inner, frame.option, parent_tag))
+                if frame.subtree_key is not None:
+                    subtree_start = frame.subtree_start
+                    source = data[ends[token_end] - frame.subtree_key[1]:ends[token_end]]
+                    pieces = tuple(output[subtree_start:])
+                    subtree_cache.set(frame.subtree_key, (
+                        source,
+                        pieces,
+                        tuple(index - subtree_start for index in newline_pieces[newline_start:]),
+                        has_word,
+                    ), size=sys.getsizeof(source) + sum(map(sys.getsizeof, pieces)))
+                    is_storing_subtree = False
+                has_word = has_word or frame.has_word
+            else:
+                break
 
-                    # If the end tag should not be consumed, back up one (after processing the
-                    # embedded tokens)
-                    if not consume_now:
-                        token_end -= 1
+            # If the end tag should not be consumed, back up one (after processing the embedded
+            # tokens)
+            if not consume_now:
+                token_end -= 1
 
-                    if tag._options.render_embedded:
-                        inner = self._render_tokens(embedded_tokens, parent_tag=tag)
-                    else:
-                        inner = self._render_textual_content(
-                            ''.join(tk.text for tk in embedded_tokens),
-                            tag._options.escape_html, tag._options.replace_links,
-                            tag._options.render_embedded)
-
-                    # Strip and replaces newlines if specified in the tag options
-                    if tag._options.strip:
-                        inner = inner.strip()
-                    if tag._options.transform_newlines:
-                        inner = inner.replace('\n', self.newline_char)
-
-                    # Append the rendered data
-                    rendered.append(call_rendering_function(self, inner, token.option, parent_tag))
-
-                    # Swallow the first trailing newline if necessary
-                    if tag._options.swallow_trailing_newline:
-                        next_itk = token_end + 1
-                        if next_itk < len(tokens) and tokens[next_itk].is_newline:
-                            token_end = next_itk
-
-                    # Goto the end tag index
-                    itk = token_end
-            elif token.is_data:
-                replace_specialchars = parent_tag._options.escape_html if parent_tag else True
-                replace_links = parent_tag._options.replace_links if parent_tag else True
-                replace_smilies = parent_tag._options.render_embedded if parent_tag else True
-                rendered.append(self._render_textual_content(
-                    token.text, replace_specialchars, replace_links, replace_smilies))
-            elif token.is_newline:
-                rendered.append(self.newline_char if parent_tag is None else token.text)
-
-            # Goto the next token!
-            itk += 1
-        return ''.join(rendered)
+            # Swallow the first trailing newline if necessary
+            if tag_flags & OPT_SWALLOW_TRAILING_NEWLINE:
+                next_itk = token_end + 1
+                if next_itk < end and kinds[next_itk] == TK_NEWLINE:
+                    token_end = next_itk
+
+            # Goto the token following the end tag
+            itk = token_end + 1
+        return ''.join(output)
+
+    def _render_tag(self, renderer, tag_flags, inner, option, parent_tag):
+        """
+        Given the renderer and the option flags of a tag and its rendered content, strip and
+        replace the newlines of this content if specified in the tag options and return the
+        rendered tag.
+        """
+        if tag_flags & OPT_STRIP:
+            inner = inner.strip()
+        if tag_flags & OPT_TRANSFORM_NEWLINES:
+            inner = inner.replace('\n', self.newline_char)
+        return renderer(self, inner, option, parent_tag)
+
+    def _wrap_content(
+            self, tag_flags, wrapping_strings, option, output, content_start, newline_pieces,
+            newline_start, has_word):
+        """
+        Completes the rendering of a wrapping tag whose prefix has been output before the pieces
+        of its content, which start at 'content_start'. This is the counterpart of the _render_tag
+        method for these tags: the pieces of the content are updated in place. Returns True if the
+        rendered tag contains word characters.
+        """
+        prefix, suffix, invalid_prefix, invalid_suffix = wrapping_strings
+
+        has_word = self._strip_and_transform_pieces(
+            tag_flags, output, content_start, newline_pieces, newline_start) or has_word
+
+        # The content is only valid if it contains word characters ; otherwise the tag is output
+        # as defined in its definition string
+        if not has_word:
+            if not option:
+                invalid_prefix = invalid_prefix.replace('=', '')
+                invalid_suffix = invalid_suffix.replace('=', '')
+                for index in range(content_start, len(output)):
+                    output[index] = output[index].replace('=', '')
+            prefix, suffix = invalid_prefix, invalid_suffix
+            output[content_start - 1] = prefix
+        output.append(suffix)
+        return has_word or _word_re.search(prefix + suffix) is not None
+
+    def _render_textual_tokens(self, tokens, start, end, parent_flags=None):
+        """
+        Renders the run of adjacent data and newline tokens whose indexes are in the [start, end)
+        range. The textual transformations are applied once to the whole run, according to the
+        option flags of the enclosing tag if any.
+        """
+        kinds, data, starts, ends = tokens.kinds, tokens.data, tokens.starts, tokens.ends
+        if parent_flags is None:
+            replace_specialchars = replace_links = replace_smilies = True
+            newline = self.newline_char
+        else:
+            replace_specialchars = bool(parent_flags & OPT_ESCAPE_HTML)
+            replace_links = bool(parent_flags & OPT_REPLACE_LINKS)
+            replace_smilies = bool(parent_flags & OPT_RENDER_EMBEDDED)
+            newline = '\n'
+
+        texts = [
+            data[starts[index]:ends[index]] if kinds[index] == TK_DATA else ''
+            for index in range(start, end)]
+        if len(texts) > 1 and not self._has_multiline_replacements():
+            # The texts of the tokens are joined with newlines, which cannot be part of a link, a
+            # smiley or an HTML replacement: the textual transformations cannot span several
+            # tokens and the rendered texts can be split on these newlines afterwards
+            texts = self._render_textual_content(
+                '\n'.join(texts), replace_specialchars, replace_links, replace_smilies).split('\n')
+        else:
+            texts = [
+                self._render_textual_content(
+                    text, replace_specialchars, replace_links, replace_smilies) if text else text
+                for text in texts]
+        return ''.join(
+            text if kinds[index] == TK_DATA else newline
+            for index, text in zip(range(start, end), texts))
+
+    def _strip_and_transform_pieces(
+            self, tag_flags, output, content_start, newline_pieces, newline_start):
+        """
+        Strip the content of a tag, made of the output pieces starting at 'content_start', and
+        replace its newlines if specified in the option flags of the tag. Only the pieces at the
+        boundaries of the content are stripped and only the pieces containing newlines, which are
+        listed in 'newline_pieces' from 'newline_start', are transformed: the rendered content is
+        not scanned again for each enclosing tag. Returns True if the transformed pieces contain
+        word characters.
+        """
+        if tag_flags & OPT_STRIP:
+            for index in range(content_start, len(output)):
+                output[index] = output[index].lstrip()
+                if output[index]:
+                    break
+            for index in range(len(output) - 1, content_start - 1, -1):
+                output[index] = output[index].rstrip()
+                if output[index]:
+                    break
+
+        # The pieces that still contain newlines after the transformation are kept for the
+        # enclosing tags
+        has_word = False
+        if tag_flags & OPT_TRANSFORM_NEWLINES:
+            remaining_newline_pieces = []
+            for index in newline_pieces[newline_start:]:
+                output[index] = output[index].replace('\n', self.newline_char)
+                has_word = has_word or _word_re.search(output[index]) is not None
+                if '\n' in output[index]:
+                    remaining_newline_pieces.append(index)
+            newline_pieces[newline_start:] = remaining_newline_pieces
+        return has_word
 
     def _render_textual_content(self, data, replace_specialchars, replace_links, replace_smilies):
         """
         Given an input text, update it by replacing the HTML special characters, the links with
-        their HTML corresponding tags and the smilies codes with the corresponding images.
+        their HTML corresponding tags and the smilies codes with the corresponding images. The
+        links and the smilies codes are found in a single left-to-right scan of the escaped text.
+        The leftmost replacement wins: a smiley code that ends inside a run of domain name
+        characters (eg. ':D' in ':Dwww.example.com/') is replaced and no link can start in the
+        rest of this run.
         """
         if replace_specialchars:
-            data = replace(data, self.replace_html)
+            for special_char, escaped_char in self.replace_html:
+                if special_char in data:
+                    data = data.replace(special_char, escaped_char)
 
-        if replace_links:
-            def linkrepl(match):
-                url = match.group(0)
-                href = url if '://' in url else 'http://' + url
-                return '<a href="{0}">{1}</a>'.format(href, url)
-            data = re.sub(url_re, linkrepl, data)
+        textual_re = self._get_textual_re(replace_links, replace_smilies)
+        if textual_re is None:
+            return data
 
-        if replace_smilies:
-            data = replace(data, sorted(self.smilies.items(), reverse=True))
+        rendered = []
+        # The position following the last replaced link or smiley code and the position before
+        # which all the possible starts of links have already been checked
+        pos = checked = 0
+        link_matcher = LinkMatcher(data)
+        match = textual_re.search(data)
+        while match:
+            start = end = match.start()
+            if match.lastgroup == 'smiley':
+                end = match.end()
+                replacement = self.smilies[match.group(0)]
+                # The links cannot start in the rest of the run of domain name characters
+                checked = max(checked, get_domain_run_end(data, end))
+            else:
+                link = link_matcher.match(start, max(pos, checked)) if start >= checked else None
+                checked = max(checked, start + 1)
+                if link:
+                    start, end = link
+                    url = data[start:end]
+                    href = url if '://' in url else 'http://' + url
+                    replacement = '<a href="{0}">{1}</a>'.format(href, url)
+                elif replace_smilies and self._smilies_trie:
+                    # A smiley code can start with a link anchor
+                    smiley = self._get_smilies_re().match(data, start)
+                    if smiley:
+                        end = smiley.end()
+                        replacement = self.smilies[smiley.group(0)]
+                        checked = max(checked, get_domain_run_end(data, end))
 
-        return data
+            if end > start:
+                rendered.append(data[pos:start])
+                rendered.append(replacement)
+                pos = end
+                match = textual_re.search(data, end)
+            else:
+                match = textual_re.search(data, start + 1)
+
+        if not pos:
+            return data
+        rendered.append(data[pos:])
+        return ''.join(rendered)
+
+    def _get_smilies_re(self):
+        """
+        Returns the regex matching the longest smiley code starting at a given position.
+        """
+        if self._smilies_re is None:
+            self._smilies_re = re.compile(_get_trie_pattern(self._smilies_trie))
+        return self._smilies_re
+
+    def _get_textual_re(self, replace_links, replace_smilies):
+        """
+        Returns the regex matching the link anchors and/or the smiley codes that should be
+        replaced in the texts, or None if there is nothing to match. These regexes are compiled
+        once for each combination of the 'replace_links' and 'replace_smilies' tag options.
+        """
+        key = (replace_links, replace_smilies and bool(self._smilies_trie))
+        try:
+            return self._textual_res[key]
+        except KeyError:
+            # The patterns start with the class of the first characters of the link anchors and
+            # of the smiley codes, which allows the regex engine to quickly skip the other
+            # characters. The rest of each anchor or code is matched after checking its first
+            # character with a lookbehind assertion
+            first_chars, groups = '', []
+            if key[0]:
+                first_chars += ''.join(chars for chars, _ in LINK_ANCHORS)
+                groups.append('(?P<link>{})'.format('|'.join(
+                    '(?<=[{}]){}'.format(re.escape(chars), rest) for chars, rest in LINK_ANCHORS)))
+            if key[1]:
+                first_chars += ''.join(char for char in self._smilies_trie)
+                groups.append('(?P<smiley>{})'.format('|'.join(
+                    '(?<={}){}'.format(re.escape(char), _get_trie_pattern(child))
+                    for char, child in sorted(self._smilies_trie.items()))))
+            textual_re = self._textual_res[key] = re.compile('[{}](?:{})'.format(
+                ''.join(re.escape(char) for char in sorted(set(first_chars))), '|'.join(groups))) \
+                if groups else None
+            return textual_re
 
     def render(self, data):
         """
-        Renders the given data by using the declared BBCodes tags.
+        Renders the given data by using the declared BBCodes tags. The rendered data is cached in
+        the 'render_cache' LRU cache if the BBCODE_RENDER_LRU_CACHE_BYTES setting is set.
         """
-        lexical_units = self._drop_syntactic_errors(self.get_tokens(data))
+        if not self.render_cache.maxbytes:
+            return self._render(data)
+        rendered = self.render_cache.get(data)
+        if rendered is None:
+            rendered = self._render(data)
+            self.render_cache.set(data, rendered)
+        return rendered
+
+    def _render(self, data):
+        data = self._normalize(data)
+        if self._TAG_OPENING not in data:
+            # The data cannot contain any BBCode tag: there is no need to tokenize it
+            return self._render_plain_text(data)
+        lexical_units = self._drop_syntactic_errors(self._build_token_stream(data))
         rendered = self._render_tokens(lexical_units)
         return rendered
+
+    def _has_multiline_replacements(self):
+        """
+        Returns True if a smiley or an HTML replacement involves newlines: the textual
+        transformations cannot be applied to several lines at once in this case.
+        """
+        return self._multiline_smilies or \
+            any('\n' in old or '\n' in new for old, new in self.replace_html)
+
+    def _render_plain_text(self, data):
+        """
+        Renders the given normalized data, which does not contain any BBCode tag. The result is
+        the same as the one produced by rendering each line of the data separately.
+        """
+        if self._has_multiline_replacements():
+            return self.newline_char.join(
+                self._render_textual_content(line, True, True, True) for line in data.split('\n'))
+        # The textual transformations do not involve any newline (the links cannot span several
+        # lines): they can be applied to the whole data at once
+        return self._render_textual_content(data, True, True, True).replace(
+            '\n', self.newline_char)
+
+
+def _get_klass_path(instance):
+    klass = type(instance)
+    return '{}.{}'.format(klass.__module__, klass.__name__)
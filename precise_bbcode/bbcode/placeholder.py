@@ -1,4 +1,5 @@
 import re
+from functools import partial
 
 from precise_bbcode.bbcode.exceptions import InvalidBBCodePlaholder
 from precise_bbcode.core.compat import pattern_type
@@ -86,3 +87,17 @@ class BBCodePlaceholder(with_metaclass(BBCodePlaceholderBase)):
         # In any other case a NotImplementedError is raised to ensure
         # that any subclasses must override this method
         raise NotImplementedError
+
+    def get_validator(self, extra_context=None):
+        """
+        Returns a callable validating any content according to the placeholder definition and to
+        the given extra context. This callable takes the content to validate as its only argument.
+
+        BBCode tags bind a validator to each of their placeholders when they are added to a
+        parser. Subclasses can override this method in order to parse their extra context once
+        (eg. to build a set of valid choices) instead of parsing it each time a content is
+        validated. The default implementation relies on the 'validate' method.
+        """
+        if type(self).validate is BBCodePlaceholder.validate and self.pattern:
+            return self.pattern.search
+        return partial(self.validate, extra_context=extra_context)
@@ -14,3 +14,20 @@ placeholder_content_re = re.compile(r'^(?P<placeholder_name>[a-zA-Z]+)(\d*)(=[^\
 bbcodde_standard_re = r'^\[(?P<start_name>[^\s=\[\]]*)(=\{[a-zA-Z]+\d*=?[^\s\[\]\{\}=]*\})?\]\{[a-zA-Z]+\d*=?[^\s\[\]\{\}=]*\}(\[/(?P<end_name>[^\s=\[\]]*)\])?$'  # noqa
 bbcodde_standalone_re = r'^\[(?P<start_name>[^\s=\[\]]*)(=\{[a-zA-Z]+\d*=?[^\s\[\]\{\}=]*\})?\]\{?[a-zA-Z]*\d*=?[^\s\[\]\{\}=]*\}?$'  # noqa
 bbcode_content_re = re.compile(r'^\[[A-Za-z0-9]*\](?P<content>.*)\[/[A-Za-z0-9]*\]')
+
+
+# BBCode lexer regexes
+# The following regex is used to scan a BBCode content in a single left-to-right pass. Each match
+# corresponds to one lexical unit: a newline, a run of text, a well-formed tag (whose name and
+# option are captured), a bracketed chunk that cannot be a tag (eg. because it contains a newline)
+# or an opening bracket that is not closed before the next one.
+bbcode_lexer_re = re.compile(r"""
+    (?P<newline>\n)
+    |(?P<text>[^\[\n]+)
+    |(?P<tag>\[[^\S\n\r]*(?:
+        /[^\S\n\r]*(?P<end_name>[^\s=\[\]]+)[^\S\n\r]*
+        |(?P<start_name>[^\s=\[\]/][^\s=\[\]]*)[^\S\n\r]*(?:=(?P<option>[^\[\]\n\r]*))?
+    )\])
+    |(?P<bracketed>\[[^\[\]]*\])
+    |(?P<opening>\[[^\[\]\n]*)
+""", re.VERBOSE)
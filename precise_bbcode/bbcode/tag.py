@@ -101,6 +101,13 @@ class BBCodeTagBase(type):
                 raise InvalidBBCodeTag(
                     'The placeholders defined in the tag definition must be strictly uniques')
 
+            # Initializes the '_render_plan' attribute: nothing in the default rendering of the
+            # tag depends on its content except the values of its placeholders
+            setattr(new_tag, '_render_plan', BBCodeTagRenderPlan(
+                new_tag.definition_string, new_tag.format_string))
+        else:
+            setattr(new_tag, '_render_plan', None)
+
         return new_tag
 
 
@@ -109,6 +116,10 @@ class BBCodeTag(with_metaclass(BBCodeTagBase)):
     definition_string = None
     format_string = None
 
+    # The validators of the placeholders of the tag, keyed by placeholder strings. They are bound
+    # when the tag is added to a parser
+    _placeholder_validators = None
+
     def do_render(self, parser, value, option=None, parent=None):
         """
         This method is called by the BBCode parser to render the content of
@@ -143,33 +154,40 @@ class BBCodeTag(with_metaclass(BBCodeTagBase)):
         raise NotImplementedError
 
     def _render_default(self, parser, value, option=None, parent=None):
-        placeholders = re.findall(placeholder_re, self.definition_string)
+        render_plan = self._render_plan
         # Get the format data
         fmt = {}
-        if len(placeholders) == 1:
-            fmt.update({placeholders[0]: value})
-        elif len(placeholders) == 2:
-            fmt.update({
-                placeholders[1]: value,
-                placeholders[0]: replace(option, bbcode_settings.BBCODE_ESCAPE_HTML) if option else ''  # noqa
-            })
+        if render_plan.content_placeholder:
+            fmt[render_plan.content_placeholder] = value
+        if render_plan.option_placeholder:
+            fmt[render_plan.option_placeholder] = \
+                replace(option, bbcode_settings.BBCODE_ESCAPE_HTML) if option else ''
 
         # Semantic validation
         valid = self._validate_format(parser, fmt)
         if not valid and option:
-            return self.definition_string.format(**fmt)
+            return render_plan.fill_definition(fmt)
         elif not valid:
-            return self.definition_string.format(**fmt).replace('=', '')
-
-        # Before rendering, it's necessary to escape the included braces: '{' and '}' ; some of them
-        # could not be placeholders
-        escaped_format_string = self.format_string.replace('{', '{{').replace('}', '}}')
-        for placeholder in fmt.keys():
-            escaped_format_string = escaped_format_string.replace(
-                '{' + placeholder + '}', placeholder)
+            return render_plan.fill_definition(fmt).replace('=', '')
 
         # Return the rendered data
-        return escaped_format_string.format(**fmt)
+        return render_plan.fill_format(fmt)
+
+    def _bind_placeholders(self, placeholders):
+        """
+        Given a dictionary of placeholder instances keyed by their uppercase names, binds each
+        placeholder of the tag to a validator whose extra context is already parsed. The unknown
+        placeholders are not bound: they will raise an error when the tag is rendered.
+        """
+        self._placeholder_validators = {}
+        if not self._render_plan:
+            return
+        for placeholder_string, placeholder_context in \
+                self._render_plan.placeholder_contexts.items():
+            if placeholder_context and placeholder_context[0] in placeholders:
+                placeholder_type, extra_context = placeholder_context
+                self._placeholder_validators[placeholder_string] = \
+                    placeholders[placeholder_type].get_validator(extra_context)
 
     def _validate_format(self, parser, format_dict):
         """
@@ -178,21 +196,83 @@ class BBCodeTag(with_metaclass(BBCodeTagBase)):
         eg. {TEXT} or {TEXT1} refer to the 'TEXT' BBCode placeholder type.
         Each content is validated according to its associated placeholder type.
         """
+        placeholder_validators = self._placeholder_validators or {}
+        placeholder_contexts = self._render_plan.placeholder_contexts if self._render_plan else {}
         for placeholder_string, content in format_dict.items():
+            if placeholder_string in placeholder_contexts:
+                placeholder_context = placeholder_contexts[placeholder_string]
+            else:
+                placeholder_context = get_placeholder_context(placeholder_string)
+            if not placeholder_context:
+                return False
+            placeholder_type, extra_context = placeholder_context
             try:
-                placeholder_results = re.findall(placeholder_content_re, placeholder_string)
-                assert len(placeholder_results)
-                placeholder_type, _, extra_context = placeholder_results[0]
-                valid_content = parser.placeholders[placeholder_type.upper()].validate(
-                    content, extra_context=extra_context[1:])
-                assert valid_content and valid_content is not None
+                validator = placeholder_validators.get(placeholder_string)
+                if validator is None:
+                    validator = parser.placeholders[placeholder_type].get_validator(extra_context)
+                valid_content = validator(content)
             except KeyError:
                 raise InvalidBBCodePlaholder(placeholder_type)
-            except AssertionError:
+            if not valid_content:
                 return False
         return True
 
 
+def get_placeholder_context(placeholder_string):
+    """
+    Given a placeholder string (eg. 'TEXT' or 'RANGE=4,7'), returns a 2-tuple of the form
+    (placeholder_type, extra_context), or None if the placeholder string is not valid.
+    """
+    placeholder_results = re.findall(placeholder_content_re, placeholder_string)
+    if not placeholder_results:
+        return None
+    placeholder_type, _, extra_context = placeholder_results[0]
+    return placeholder_type.upper(), extra_context[1:]
+
+
+class BBCodeTagRenderPlan(object):
+    """
+    Holds everything that is needed to render a BBCode tag defined by a definition string and a
+    format string: the placeholders of the tag, their role and the templates of the format string
+    and of the definition string that are ready to be filled with the values of these placeholders.
+    """
+    def __init__(self, definition_string, format_string):
+        placeholders = re.findall(placeholder_re, definition_string)
+        # The content of the tag is bound to its last placeholder while its option is bound to the
+        # first placeholder of the tags that define two placeholders
+        self.content_placeholder = placeholders[-1] if placeholders else None
+        self.option_placeholder = placeholders[0] if len(placeholders) == 2 else None
+        self.placeholder_contexts = dict(
+            (placeholder, get_placeholder_context(placeholder)) for placeholder in placeholders)
+        self.definition_parts, self.definition_placeholders = self._split(
+            definition_string, placeholders)
+        self.format_parts, self.format_placeholders = self._split(format_string, placeholders)
+        # The templates are filled by the values of the placeholders using the '%' operator
+        self.definition_template = '%s'.join(
+            part.replace('%', '%%') for part in self.definition_parts)
+        self.format_template = '%s'.join(part.replace('%', '%%') for part in self.format_parts)
+
+    def _split(self, string, placeholders):
+        """
+        Splits the given string on the given placeholders and returns a 2-tuple of the form
+        (parts, placeholders) where the parts are the strings surrounding the placeholders and where
+        the placeholders are the ones found in the given string, in order.
+        """
+        if not placeholders:
+            return [string], ()
+        parts = re.split('({})'.format('|'.join(
+            re.escape('{' + placeholder + '}') for placeholder in placeholders)), string)
+        return parts[::2], tuple(part[1:-1] for part in parts[1::2])
+
+    def fill_definition(self, fmt):
+        return self.definition_template % tuple(
+            fmt[placeholder] for placeholder in self.definition_placeholders)
+
+    def fill_format(self, fmt):
+        return self.format_template % tuple(
+            fmt[placeholder] for placeholder in self.format_placeholders)
+
+
 class BBCodeTagOptions(object):
     # Force the closing of this tag after a newline
     newline_closes = False
@@ -26,6 +26,34 @@ BBCODE_ALLOW_CUSTOM_TAGS = getattr(settings, 'BBCODE_ALLOW_CUSTOM_TAGS', True)
 # Other options
 BBCODE_NORMALIZE_NEWLINES = getattr(settings, 'BBCODE_NORMALIZE_NEWLINES', True)
 
+# The lexer engine used to tokenize BBCode contents ('regex' or 'legacy')
+BBCODE_LEXER = getattr(settings, 'BBCODE_LEXER', 'regex')
+
+# The maximum number of URL validation results kept in memory (None means no limit)
+BBCODE_URL_VALIDATION_CACHE_SIZE = getattr(settings, 'BBCODE_URL_VALIDATION_CACHE_SIZE', 4096)
+
+# Should the tags be rendered by generated render functions?
+BBCODE_COMPILE_TAGS = getattr(settings, 'BBCODE_COMPILE_TAGS', False)
+
+# The directory where the generated render functions are cached (None means that they are only
+# kept in memory)
+BBCODE_COMPILED_TAGS_DIR = getattr(settings, 'BBCODE_COMPILED_TAGS_DIR', None)
+
+# The maximum number of bytes of rendered texts kept in memory by each parser (0 means that they
+# are not cached)
+BBCODE_RENDER_LRU_CACHE_BYTES = getattr(settings, 'BBCODE_RENDER_LRU_CACHE_BYTES', 0)
+
+# The maximum number of bytes of rendered tag subtrees kept in memory by each parser (0 means that
+# they are not cached)
+BBCODE_SUBTREE_CACHE_BYTES = getattr(settings, 'BBCODE_SUBTREE_CACHE_BYTES', 0)
+
+# The alias of the cache used to store the rendered texts (None means that they are not cached)
+BBCODE_RENDER_CACHE = getattr(settings, 'BBCODE_RENDER_CACHE', None)
+# The number of seconds the rendered texts are cached (None means the timeout of the cache)
+BBCODE_RENDER_CACHE_TIMEOUT = getattr(settings, 'BBCODE_RENDER_CACHE_TIMEOUT', None)
+# The number of seconds the other processes wait for a text that is being rendered
+BBCODE_RENDER_CACHE_LOCK_TIMEOUT = getattr(settings, 'BBCODE_RENDER_CACHE_LOCK_TIMEOUT', 10)
+
 
 # Smileys options
 BBCODE_ALLOW_SMILIES = getattr(settings, 'BBCODE_ALLOW_SMILIES', True)
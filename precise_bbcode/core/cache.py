@@ -0,0 +1,140 @@
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+
+class RenderCache(object):
+    """
+    Caches the HTML outputs of a BBCode parser in one of the caches defined by the CACHES Django
+    setting, so that they can be shared by several processes or servers. The outputs are keyed by
+    a hash of the rendered texts and by the fingerprint of the parser configuration.
+
+    Only one process renders a given text when this text is missed by several processes at once:
+    the first process acquires a lock in the cache while the other processes wait for the output
+    to be stored in the cache. One of these processes acquires the lock in turn if it is released
+    without output (eg. if the rendering failed) ; they all render the text themselves if this
+    output is not available after 'lock_timeout' seconds.
+    """
+    key_prefix = 'precise_bbcode'
+
+    def __init__(self, alias, timeout=None, lock_timeout=10, poll_interval=0.05):
+        self.alias = alias
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_key(self, parser, text):
+        """
+        Returns the cache key of the output of the given parser for the given text.
+        """
+        text_hash = hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest()
+        return '{}:render:{}:{}'.format(self.key_prefix, parser.get_fingerprint(), text_hash)
+
+    def render(self, parser, text):
+        """
+        Returns the HTML output of the given parser for the given text, from the cache if possible.
+        """
+        cache = self.cache
+        key = self.get_key(parser, text)
+        rendered = cache.get(key)
+        if rendered is not None:
+            return rendered
+
+        lock_key = key + ':lock'
+        deadline = time.monotonic() + self.lock_timeout
+        while not cache.add(lock_key, True, self.lock_timeout):
+            # Another process is rendering the same text: its output is awaited until the lock is
+            # released, in which case the lock is acquired again since this process may have
+            # failed to render the text
+            if time.monotonic() >= deadline:
+                return parser.render(text)
+            time.sleep(self.poll_interval)
+            rendered = cache.get(key)
+            if rendered is not None:
+                return rendered
+
+        try:
+            # The output may have been stored by the process that released the lock
+            rendered = cache.get(key)
+            if rendered is None:
+                rendered = parser.render(text)
+                self._set(cache, key, rendered)
+        finally:
+            cache.delete(lock_key)
+        return rendered
+
+    def _set(self, cache, key, rendered):
+        if self.timeout is None:
+            cache.set(key, rendered)
+        else:
+            cache.set(key, rendered, self.timeout)
+
+
+class BytesLRUCache(object):
+    """
+    A thread-safe LRU cache of strings which is bounded by the total size of its keys and values,
+    in bytes, rather than by a number of entries. The least recently used entries are evicted
+    once the size of the cache exceeds 'maxbytes' ; the values that are too large to fit in the
+    cache are not stored. The hits, misses and evictions of the cache are recorded.
+    """
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.currbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Returns the value associated with the given key or None if it is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size=None):
+        """
+        Stores the given value in the cache, evicting the least recently used entries if needed.
+        The size of the entry can be given if the key or the value is a container: only the size
+        of strings is computed by default.
+        """
+        if size is None:
+            size = sys.getsizeof(key) + sys.getsizeof(value)
+        if size > self.maxbytes:
+            return
+        with self._lock:
+            previous_entry = self._entries.pop(key, None)
+            if previous_entry is not None:
+                self.currbytes -= previous_entry[1]
+            self._entries[key] = (value, size)
+            self.currbytes += size
+            while self.currbytes > self.maxbytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.currbytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Empties the cache. Its hit, miss and eviction counters are not reset.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.currbytes = 0
@@ -0,0 +1,42 @@
+from functools import lru_cache
+
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+
+from precise_bbcode.conf import settings as bbcode_settings
+
+
+class CachedURLValidator(object):
+    """
+    Validates URLs by using a single Django URLValidator instance. The results are memoized in a
+    bounded LRU cache keyed by the validated URLs: the same URLs tend to appear again and again in
+    BBCode contents and running the URLValidator regex is costly.
+    """
+    def __init__(self, maxsize=None):
+        self.validator = URLValidator()
+        self.is_valid = lru_cache(maxsize=maxsize)(self._is_valid)
+
+    def _is_valid(self, url):
+        try:
+            self.validator(url)
+        except ValidationError:
+            return False
+        return True
+
+    @property
+    def hits(self):
+        return self.is_valid.cache_info().hits
+
+    @property
+    def misses(self):
+        return self.is_valid.cache_info().misses
+
+    def clear(self):
+        """
+        Empties the cache and resets its hit and miss counters.
+        """
+        self.is_valid.cache_clear()
+
+
+# The URL validator shared by the BBCode tags and the BBCode placeholders
+url_validator = CachedURLValidator(maxsize=bbcode_settings.BBCODE_URL_VALIDATION_CACHE_SIZE)
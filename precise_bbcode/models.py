@@ -145,7 +145,7 @@ class BBCodeTag(models.Model):
         # Remove the deleted tag from the BBCode parser pool of
         # available bbcode tags
         parser = get_parser()
-        parser.bbcodes.pop(tag_name)
+        parser.remove_bbcode_tag(tag_name)
 
     def get_parser_tag_klass(self, tag_name=None):
         # Construct the inner Options class
@@ -1,9 +1,18 @@
 from precise_bbcode.bbcode import get_parser
+from precise_bbcode.conf import settings as bbcode_settings
+from precise_bbcode.core.cache import RenderCache
 
 
 def render_bbcodes(text):
     """
-    Given an input text, calls the BBCode parser to get the corresponding HTML output.
+    Given an input text, calls the BBCode parser to get the corresponding HTML output. The output
+    is retrieved from the cache defined by the BBCODE_RENDER_CACHE setting if it is set.
     """
     parser = get_parser()
+    if bbcode_settings.BBCODE_RENDER_CACHE:
+        render_cache = RenderCache(
+            bbcode_settings.BBCODE_RENDER_CACHE,
+            timeout=bbcode_settings.BBCODE_RENDER_CACHE_TIMEOUT,
+            lock_timeout=bbcode_settings.BBCODE_RENDER_CACHE_LOCK_TIMEOUT)
+        return render_cache.render(parser, text)
     return parser.render(text)
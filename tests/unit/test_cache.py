@@ -0,0 +1,226 @@
+import sys
+import threading
+import time
+
+import pytest
+from django.core.cache import cache
+
+from precise_bbcode.bbcode import BBCodeParser
+from precise_bbcode.bbcode import BBCodeParserLoader
+from precise_bbcode.bbcode import get_parser
+from precise_bbcode.conf import settings as bbcode_settings
+from precise_bbcode.core.cache import BytesLRUCache
+from precise_bbcode.core.cache import RenderCache
+from precise_bbcode.shortcuts import render_bbcodes
+from precise_bbcode.test import gen_bbcode_tag_klass
+
+
+class SlowParser(object):
+    def __init__(self):
+        self.renders = 0
+
+    def get_fingerprint(self):
+        return 'slow'
+
+    def render(self, text):
+        self.renders += 1
+        time.sleep(0.2)
+        return '<p>{}</p>'.format(text)
+
+
+class FailingParser(SlowParser):
+    def render(self, text):
+        rendered = super(FailingParser, self).render(text)
+        if self.renders == 1:
+            raise ValueError(text)
+        return rendered
+
+
+class TestRenderCache(object):
+    def setup_method(self, method):
+        cache.clear()
+        self.parser = BBCodeParser()
+        loader = BBCodeParserLoader(parser=self.parser)
+        loader.init_default_bbcode_placeholders()
+        loader.init_default_bbcode_tags()
+
+    def test_can_cache_the_rendered_texts(self):
+        # Setup
+        render_cache = RenderCache('default')
+        # Run
+        rendered = render_cache.render(self.parser, '[b]hello[/b]')
+        # Check
+        assert rendered == '<strong>hello</strong>'
+        assert cache.get(render_cache.get_key(self.parser, '[b]hello[/b]')) == rendered
+        cache.set(render_cache.get_key(self.parser, '[b]hello[/b]'), 'cached')
+        assert render_cache.render(self.parser, '[b]hello[/b]') == 'cached'
+
+    def test_the_cache_keys_depend_on_the_configuration_of_the_parser(self):
+        # Setup
+        render_cache = RenderCache('default')
+        other_parser = BBCodeParser()
+        loader = BBCodeParserLoader(parser=other_parser)
+        loader.init_default_bbcode_placeholders()
+        loader.init_default_bbcode_tags()
+        key = render_cache.get_key(self.parser, 'hello :)')
+        # Run & check
+        assert render_cache.get_key(other_parser, 'hello :)') == key
+        assert render_cache.get_key(self.parser, 'hello :(') != key
+        other_parser.add_smiley(':)', '<img src="smile.png" />')
+        assert render_cache.get_key(other_parser, 'hello :)') != key
+        self.parser.add_bbcode_tag(gen_bbcode_tag_klass({
+            'name': 'b', 'definition_string': '[b]{TEXT}[/b]', 'format_string': '<b>{TEXT}</b>'}))
+        assert render_cache.get_key(self.parser, 'hello :)') != key
+
+    def test_render_the_texts_missed_by_several_threads_only_once(self):
+        # Setup
+        render_cache = RenderCache('default', poll_interval=0.01)
+        parser = SlowParser()
+        results = []
+
+        def render():
+            results.append(render_cache.render(parser, 'hello'))
+        threads = [threading.Thread(target=render) for _ in range(5)]
+        # Run
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Check
+        assert parser.renders == 1
+        assert results == ['<p>hello</p>'] * 5
+
+    def test_render_the_texts_whose_lock_is_released_without_output(self):
+        # Setup
+        render_cache = RenderCache('default', lock_timeout=5, poll_interval=0.01)
+        parser = FailingParser()
+        lock_key = render_cache.get_key(parser, 'hello') + ':lock'
+        errors = []
+
+        def render():
+            try:
+                render_cache.render(parser, 'hello')
+            except ValueError as e:
+                errors.append(e)
+        thread = threading.Thread(target=render)
+        thread.start()
+        while cache.get(lock_key) is None and parser.renders == 0:
+            time.sleep(0.01)
+        # Run
+        start = time.monotonic()
+        rendered = render_cache.render(parser, 'hello')
+        thread.join()
+        # Check
+        assert rendered == '<p>hello</p>'
+        assert time.monotonic() - start < 2
+        assert len(errors) == 1
+        assert parser.renders == 2
+        assert cache.get(lock_key) is None
+
+    def test_do_not_render_the_texts_stored_before_the_lock_is_acquired(self):
+        # Setup
+        render_cache = RenderCache('default', poll_interval=0.01)
+        parser = SlowParser()
+        key = render_cache.get_key(parser, 'hello')
+        cache.add(key + ':lock', True)
+        cache_get = cache.get
+
+        def get(cache_key, *args, **kwargs):
+            # The output is stored and the lock is released right after the first lookup
+            value = cache_get(cache_key, *args, **kwargs)
+            if cache_key == key and value is None and cache_get(key + ':lock') is not None:
+                cache.set(key, 'cached')
+                cache.delete(key + ':lock')
+            return value
+        cache.get = get
+        # Run
+        try:
+            rendered = render_cache.render(parser, 'hello')
+        finally:
+            del cache.get
+        # Check
+        assert rendered == 'cached'
+        assert parser.renders == 0
+
+    def test_render_the_texts_locked_for_too_long(self):
+        # Setup
+        render_cache = RenderCache('default', lock_timeout=0.1, poll_interval=0.01)
+        parser = SlowParser()
+        cache.add(render_cache.get_key(parser, 'hello') + ':lock', True)
+        # Run & check
+        assert render_cache.render(parser, 'hello') == '<p>hello</p>'
+        assert parser.renders == 1
+
+
+class TestBytesLRUCache(object):
+    def test_can_cache_values(self):
+        # Setup
+        lru_cache = BytesLRUCache(maxbytes=1024)
+        # Run
+        lru_cache.set('foo', 'bar')
+        # Check
+        assert lru_cache.get('foo') == 'bar'
+        assert lru_cache.get('bar') is None
+        assert lru_cache.hits == 1
+        assert lru_cache.misses == 1
+        assert lru_cache.currbytes == sys.getsizeof('foo') + sys.getsizeof('bar')
+
+    def test_evict_the_least_recently_used_values_once_the_size_is_exceeded(self):
+        # Setup
+        entry_size = sys.getsizeof('k1') + sys.getsizeof('x' * 100)
+        lru_cache = BytesLRUCache(maxbytes=entry_size * 3)
+        for key in ('k1', 'k2', 'k3'):
+            lru_cache.set(key, 'x' * 100)
+        # Run
+        lru_cache.get('k1')
+        lru_cache.set('k4', 'x' * 100)
+        # Check
+        assert len(lru_cache) == 3
+        assert lru_cache.evictions == 1
+        assert lru_cache.currbytes == entry_size * 3
+        assert lru_cache.get('k2') is None
+        assert lru_cache.get('k1') is not None
+
+    def test_do_not_cache_values_larger_than_the_cache(self):
+        # Setup
+        lru_cache = BytesLRUCache(maxbytes=100)
+        # Run
+        lru_cache.set('foo', 'x' * 100)
+        # Check
+        assert len(lru_cache) == 0
+        assert lru_cache.currbytes == 0
+
+    def test_parsers_can_cache_their_outputs(self):
+        # Setup
+        parser = BBCodeParser()
+        parser.render_cache = BytesLRUCache(maxbytes=4096)
+        loader = BBCodeParserLoader(parser=parser)
+        loader.init_default_bbcode_placeholders()
+        loader.init_default_bbcode_tags()
+        # Run & check
+        assert parser.render('[b]hello :)[/b]') == '<strong>hello :)</strong>'
+        assert parser.render('[b]hello :)[/b]') == '<strong>hello :)</strong>'
+        assert parser.render_cache.hits == 1
+        parser.add_smiley(':)', '<img />')
+        assert len(parser.render_cache) == 0
+        assert parser.render('[b]hello :)[/b]') == '<strong>hello <img /></strong>'
+        parser.add_bbcode_tag(gen_bbcode_tag_klass({
+            'name': 'b', 'definition_string': '[b]{TEXT}[/b]', 'format_string': '<b>{TEXT}</b>'}))
+        assert parser.render('[b]hello :)[/b]') == '<b>hello <img /></b>'
+        assert parser.render_cache.misses == 3
+
+
+@pytest.mark.django_db
+class TestRenderBBCodes(object):
+    def setup_method(self, method):
+        cache.clear()
+
+    def test_can_use_the_render_cache(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(bbcode_settings, 'BBCODE_RENDER_CACHE', 'default')
+        # Run & check
+        assert render_bbcodes('[b]hello[/b]') == '<strong>hello</strong>'
+        cache.set(RenderCache('default').get_key(get_parser(), '[b]hello[/b]'), 'cached')
+        assert render_bbcodes('[b]hello[/b]') == 'cached'
+        monkeypatch.setattr(bbcode_settings, 'BBCODE_RENDER_CACHE', None)
+        assert render_bbcodes('[b]hello[/b]') == '<strong>hello</strong>'
@@ -0,0 +1,149 @@
+import os
+import stat
+
+from precise_bbcode.bbcode import BBCodeParser
+from precise_bbcode.bbcode import BBCodeParserLoader
+from precise_bbcode.bbcode import compiler
+from precise_bbcode.bbcode.tag import BBCodeTag
+from precise_bbcode.conf import settings as bbcode_settings
+from precise_bbcode.test import gen_bbcode_tag_klass
+
+
+class PreTag(BBCodeTag):
+    name = 'pre'
+
+    def render(self, value, option=None, parent=None):
+        return '<pre>{}</pre>'.format(value)
+
+
+class TestCompiler(object):
+    TAGS_RENDERING_TESTS = (
+        ('[b]hello [i]world![/i][/b]', '<strong>hello <em>world!</em></strong>'),
+        ('[color=green]hello[/color]', '<span style="color:green;">hello</span>'),
+        ('[color=some words]test[/color]', '[color=some words]test[/color]'),
+        ('[color]test[/color]', '[color]test[/color]'),
+        ('[code][b]100%[/b][/code]', '<code>[b]100%[/b]</code>'),
+        ('[size=24]hello[/size]', '<span style="font-size:24px;">hello</span>'),
+        ('[size=]hello[/size]', '[size]hello[/size]'),
+        ('[size=a<b]hello[/size]', '[size=a&lt;b]hello[/size]'),
+        ('[pct=50]a[/pct] [pct=150]a[/pct]', '<i title="a">50%</i> [pct=150]a[/pct]'),
+        ('[hr] [pre]x[/pre]', '<hr /> <pre>x</pre>'),
+    )
+
+    def setup_method(self, method):
+        compiler._compiled_modules.clear()
+        self.parser = BBCodeParser()
+        loader = BBCodeParserLoader(parser=self.parser)
+        loader.init_default_bbcode_placeholders()
+        loader.init_default_bbcode_tags()
+        self.parser.add_bbcode_tag(gen_bbcode_tag_klass({
+            'name': 'hr', 'definition_string': '[hr]', 'format_string': '<hr />'},
+            {'standalone': True}))
+        self.parser.add_bbcode_tag(gen_bbcode_tag_klass({
+            'name': 'size', 'definition_string': '[size={NUMBER}]{TEXT}[/size]',
+            'format_string': '<span style="font-size:{NUMBER}px;">{TEXT}</span>'}))
+        self.parser.add_bbcode_tag(gen_bbcode_tag_klass({
+            'name': 'pct', 'definition_string': '[pct={RANGE=0,100}]{TEXT}[/pct]',
+            'format_string': '<i title="{TEXT}">{RANGE=0,100}%</i>'}))
+        self.parser.add_bbcode_tag(PreTag)
+
+    def test_can_render_tags_with_generated_render_functions(self, tmpdir, monkeypatch):
+        # Setup
+        monkeypatch.setattr(bbcode_settings, 'BBCODE_COMPILED_TAGS_DIR', str(tmpdir))
+        self.parser.compile_tags = True
+        # Run
+        tag_table = self.parser._get_tag_table()
+        # Check
+        assert tag_table.renderers[tag_table.ids['color']].__name__.startswith('render_')
+        assert tag_table.renderers[tag_table.ids['pre']] == self.parser.bbcodes['pre'].do_render
+        for bbcodes_text, expected_html_text in self.TAGS_RENDERING_TESTS:
+            assert self.parser.render(bbcodes_text) == expected_html_text
+
+    def test_cache_the_generated_modules_on_disk(self, tmpdir):
+        # Setup
+        tags = list(self.parser.bbcodes.values())
+        module = compiler.load_compiled_tags(tags, str(tmpdir))
+        path = os.path.join(
+            str(tmpdir), compiler.MODULE_PREFIX + compiler.get_tags_hash(tags) + '.py')
+        with open(path, 'a') as f:
+            f.write('REUSED = True\n')
+        compiler._compiled_modules.clear()
+        # Run
+        reloaded_module = compiler.load_compiled_tags(tags, str(tmpdir))
+        # Check
+        assert module.__file__ == path
+        assert reloaded_module is not module
+        assert reloaded_module.REUSED
+        assert set(reloaded_module.RENDER_FACTORIES) == set(
+            tag.name for tag in tags if compiler.can_compile(tag))
+
+    def test_generate_a_new_module_when_the_tag_definitions_change(self, tmpdir):
+        # Setup
+        tags = list(self.parser.bbcodes.values())
+        tags_hash = compiler.get_tags_hash(tags)
+        # Run
+        self.parser.add_bbcode_tag(gen_bbcode_tag_klass({
+            'name': 'hr', 'definition_string': '[hr]', 'format_string': '<hr/>'},
+            {'standalone': True}))
+        # Check
+        assert compiler.get_tags_hash(self.parser.bbcodes.values()) != tags_hash
+        assert compiler.get_tags_hash(tags + [PreTag()]) == tags_hash
+        compiler.load_compiled_tags(self.parser.bbcodes.values(), str(tmpdir))
+        assert len([f for f in os.listdir(str(tmpdir)) if f.endswith('.py')]) == 1
+
+    def test_keep_the_generated_modules_in_memory_without_cache_directory(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(bbcode_settings, 'BBCODE_COMPILED_TAGS_DIR', None)
+        tags = list(self.parser.bbcodes.values())
+        # Run
+        module = compiler.load_compiled_tags(tags)
+        # Check
+        assert not hasattr(module, '__file__')
+        assert module.TAGS_HASH == compiler.get_tags_hash(tags)
+
+    def test_create_a_private_cache_directory(self, tmpdir):
+        # Setup
+        cache_dir = os.path.join(str(tmpdir), 'compiled')
+        tags = list(self.parser.bbcodes.values())
+        # Run
+        module = compiler.load_compiled_tags(tags, cache_dir)
+        # Check
+        assert stat.S_IMODE(os.stat(cache_dir).st_mode) & 0o077 == 0
+        assert module.__file__.startswith(cache_dir)
+
+    def test_do_not_load_the_modules_of_cache_directories_writable_by_other_users(self, tmpdir):
+        # Setup
+        tags = list(self.parser.bbcodes.values())
+        compiler.load_compiled_tags(tags, str(tmpdir))
+        path = os.path.join(
+            str(tmpdir), compiler.MODULE_PREFIX + compiler.get_tags_hash(tags) + '.py')
+        with open(path, 'a') as f:
+            f.write('REUSED = True\n')
+        compiler._compiled_modules.clear()
+        os.chmod(str(tmpdir), 0o777)
+        # Run
+        module = compiler.load_compiled_tags(tags, str(tmpdir))
+        # Check
+        assert not hasattr(module, 'REUSED')
+        assert not hasattr(module, '__file__')
+        with open(path) as f:
+            assert 'REUSED = True' in f.read()
+
+    def test_only_keep_the_module_of_the_last_tag_definitions(self, tmpdir):
+        # Setup
+        tags = list(self.parser.bbcodes.values())
+        module = compiler.load_compiled_tags(tags, str(tmpdir))
+        os.makedirs(os.path.join(str(tmpdir), '__pycache__'), exist_ok=True)
+        stale_bytecode_path = os.path.join(
+            str(tmpdir), '__pycache__', os.path.basename(module.__file__)[:-3] + '.pyc')
+        open(stale_bytecode_path, 'w').close()
+        self.parser.add_bbcode_tag(gen_bbcode_tag_klass({
+            'name': 'hr', 'definition_string': '[hr]', 'format_string': '<hr/>'},
+            {'standalone': True}))
+        # Run
+        new_module = compiler.load_compiled_tags(self.parser.bbcodes.values(), str(tmpdir))
+        # Check
+        assert list(compiler._compiled_modules.values()) == [new_module]
+        assert [f for f in os.listdir(str(tmpdir)) if f.endswith('.py')] == [
+            os.path.basename(new_module.__file__)]
+        assert not os.path.exists(stale_bytecode_path)
@@ -0,0 +1,71 @@
+import time
+
+from precise_bbcode.bbcode.links import find_links
+from precise_bbcode.bbcode.links import match_link
+from precise_bbcode.bbcode.regexes import url_re
+
+
+class TestLinks(object):
+    LINKS_TESTS = (
+        'http://foo.com/blah_blah',
+        '(Something like http://foo.com/blah_blah)',
+        'http://foo.com/blah_blah_(wikipedia)',
+        'http://foo.com/more_(than)_one_(parens)',
+        '(Something like http://foo.com/blah_blah_(wikipedia))',
+        'http://foo.com/blah_(wikipedia)#cite-1',
+        'http://foo.com/(something)?after=parens',
+        'http://foo.com/blah_blah.',
+        '<http://foo.com/blah_blah/>',
+        'http://foo.com/blah_blah,',
+        'http://www.extinguishedscholar.com/wpglob/?p=364.',
+        '<tag>http://example.com</tag>',
+        'Just a www.example.com link.',
+        'Just a WWW2.example.com link.',
+        'http://example.com/something?with,commas,in,url, but not at end',
+        'bit.ly/foo',
+        'see sub-domain.bit.ly/foo and -.-.bit.ly/foo',
+        'http://something.xx:8080',
+        'http://a http://ab www.a www.ab http://(ab) http://(ab)c',
+        'hello.x/ hello.abcde/ hello.abc/def',
+        'xhttp://foo.com _www.foo.com 1www.foo.com',
+        'http://foo.com/!!!??? (http://foo.com/(bar) http://foo.com/(bar',
+        'www.www.www.foo.com/bar http://http://foo.com',
+        'http://foo.com/&lt;bar&gt; http://foo.com/&quot;',
+    )
+
+    # Strings of URL-like characters with no valid ending that make url_re backtrack heavily
+    ADVERSARIAL_INPUTS = (
+        (1000, lambda n: 'http://' + '!' * n),
+        (1000, lambda n: 'http://' + '(a' * n),
+        (1000, lambda n: 'http://a' + '.,' * n + '('),
+        (1000, lambda n: '-a' * n + '.com/' + '!' * n),
+        (1000, lambda n: 'a.' * n + 'com/'),
+        (1000, lambda n: 'www1.' * n + ' '),
+        (1000, lambda n: '(http://' * n),
+        (1000, lambda n: '-.' * n + 'co/' + ':' * n),
+        (1000, lambda n: 'awww.' * n),
+        (1000, lambda n: '.awww.' * n + 'com/' + '!' * n),
+    )
+
+    def test_can_find_the_links_matched_by_the_url_regex(self):
+        # Run & check
+        for text in self.LINKS_TESTS:
+            assert list(find_links(text)) == [link.span() for link in url_re.finditer(text)]
+
+    def test_can_match_a_link_starting_before_its_anchor(self):
+        # Setup
+        text = 'see sub.example.com/foo'
+        # Run & check
+        assert match_link(text, text.index('.com/')) == (4, 23)
+        assert match_link(text, text.index('.com/'), 10) is None
+
+    def test_can_find_links_in_adversarial_inputs_in_linear_time(self):
+        # Run & check
+        for size, build_input in self.ADVERSARIAL_INPUTS:
+            timings = []
+            for text in (build_input(size), build_input(size * 4)):
+                start = time.perf_counter()
+                list(find_links(text))
+                timings.append(time.perf_counter() - start)
+            assert timings[1] < max(timings[0], 0.001) * 10, repr(build_input(4))
+            assert timings[1] < 0.5, repr(build_input(4))
@@ -1,4 +1,12 @@
+import sys
+from itertools import islice
+
+from precise_bbcode.bbcode import BBCodeParserLoader
 from precise_bbcode.bbcode import get_parser
+from precise_bbcode.bbcode import parser as parser_module
+from precise_bbcode.bbcode.parser import BBCodeParser
+from precise_bbcode.bbcode.parser import BBCodeToken
+from precise_bbcode.core.cache import BytesLRUCache
 from precise_bbcode.test import gen_bbcode_tag_klass
 
 
@@ -94,6 +102,8 @@ class TestParser(object):
             '[color=#ff0000;xss:expression(alert(String.fromCharCode(88,83,83)));]XSS[/color]'
         ),
         ('[', '['),
+        ('hello [world', 'hello [world'),
+        ('hello] [world', 'hello] [world'),
         # BBCodes with syntactic errors
         ('[b]z sdf s s', '[b]z sdf s s'),
         ('[b][i]hello world![/b][/i]', '<strong>[i]hello world!</strong>[/i]'),
@@ -248,6 +258,293 @@ class TestParser(object):
             result = self.parser.render(bbcodes_text)
             assert result == expected_html_text
 
+    def test_lexers_produce_the_same_tokens(self):
+        # Setup
+        sources = [bbcodes_text for bbcodes_text, _ in self.DEFAULT_TAGS_RENDERING_TESTS] + [
+            '[/b=x]', '[/]', '[/ b ]', '[b =x ]', '[url=  ]', '[b\r]hello[/b]', 'a]b[c]d[e',
+            '[[[b]]]', '[b\n]\n[/b]', '[ / quote ][QUOTE= "a" ]',
+        ]
+        # Run & check
+        try:
+            for source in sources:
+                self.parser.lexer = 'regex'
+                regex_tokens = self.parser.get_tokens(source)
+                self.parser.lexer = 'legacy'
+                legacy_tokens = self.parser.get_tokens(source)
+                assert [(tk.type, tk.tag_name, tk.option, tk.text) for tk in regex_tokens] == \
+                    [(tk.type, tk.tag_name, tk.option, tk.text) for tk in legacy_tokens]
+        finally:
+            self.parser.lexer = 'regex'
+
+    def test_can_render_default_tags_with_the_legacy_lexer(self):
+        # Run & check
+        self.parser.lexer = 'legacy'
+        try:
+            for bbcodes_text, expected_html_text in self.DEFAULT_TAGS_RENDERING_TESTS:
+                assert self.parser.render(bbcodes_text) == expected_html_text
+        finally:
+            self.parser.lexer = 'regex'
+
+    def test_tokens_are_compact(self):
+        # Setup
+        tokens = self.parser.get_tokens('[b]hello[/b]\n[b]world[/b]\n')
+        # Run & check
+        assert [tk.type for tk in tokens] == [
+            BBCodeToken.TK_START_TAG, BBCodeToken.TK_DATA, BBCodeToken.TK_END_TAG,
+            BBCodeToken.TK_NEWLINE, BBCodeToken.TK_START_TAG, BBCodeToken.TK_DATA,
+            BBCodeToken.TK_END_TAG, BBCodeToken.TK_NEWLINE,
+        ]
+        assert all(isinstance(tk.type, int) for tk in tokens)
+        assert not any(hasattr(tk, '__dict__') for tk in tokens)
+        assert tokens[3] is tokens[7]
+        assert tokens[0] is tokens[4]
+
+    def test_token_streams_reference_the_source_data(self):
+        # Setup
+        data = '[b]hello[/b]\n[b]world[/b] [url=x.com]x[/url]'
+        # Run & check
+        try:
+            for lexer in self.parser._LEXERS:
+                self.parser.lexer = lexer
+                stream = self.parser.get_token_stream(data)
+                assert stream.data is data
+                assert [stream.get_text(i) for i in range(len(stream))] == [
+                    '[b]', 'hello', '[/b]', '\n', '[b]', 'world', '[/b]', ' ', '[url=x.com]', 'x',
+                    '[/url]',
+                ]
+                assert stream.tags == [('b', None), ('url', 'x.com'), ('url', None)]
+                assert stream.tag_ids[0] == stream.tag_ids[2] == stream.tag_ids[4] == 0
+                assert stream.get_option(8) == 'x.com'
+                assert [(tk.type, tk.tag_name, tk.option, tk.text) for tk in stream] == \
+                    [(tk.type, tk.tag_name, tk.option, tk.text) for tk in
+                     self.parser.get_tokens(data)]
+        finally:
+            self.parser.lexer = 'regex'
+
+    def test_can_iterate_over_tokens_lazily(self):
+        # Setup
+        data = '[b]hello[/b]\n[i]world[/i] [' * 100000
+        # Run & check
+        try:
+            for lexer in self.parser._LEXERS:
+                self.parser.lexer = lexer
+                tokens = self.parser.iter_tokens(data)
+                assert [(tk.type, tk.tag_name, tk.text) for tk in islice(tokens, 5)] == [
+                    (BBCodeToken.TK_START_TAG, 'b', '[b]'),
+                    (BBCodeToken.TK_DATA, None, 'hello'),
+                    (BBCodeToken.TK_END_TAG, 'b', '[/b]'),
+                    (BBCodeToken.TK_NEWLINE, None, '\n'),
+                    (BBCodeToken.TK_START_TAG, 'i', '[i]'),
+                ]
+                tokens.close()
+                assert [(tk.type, tk.tag_name, tk.option, tk.text) for tk in
+                        self.parser.iter_tokens(data[:1000])] == \
+                    [(tk.type, tk.tag_name, tk.option, tk.text) for tk in
+                     self.parser.get_tokens(data[:1000])]
+        finally:
+            self.parser.lexer = 'regex'
+
+    def test_do_not_tokenize_the_content_of_tags_that_do_not_render_embedded_tags(self):
+        # Setup
+        tests = (
+            ('[code]a [b]\n[/b] c[/ CODE ]', '<code>a [b]<br />[/b] c</code>'),
+            ('[code][i][/code][/i]', '<code>[i]</code>[/i]'),
+            ('[code][code]x[/code][/code]', '<code>[code]x</code>[/code]'),
+            ('[b][code][/b][/code][/b]', '<strong><code>[/b]</code></strong>'),
+            ('[code][b]x[/b]', '[code]<strong>x</strong>'),
+        )
+        # Run & check
+        try:
+            for lexer in self.parser._LEXERS:
+                self.parser.lexer = lexer
+                tokens = self.parser.get_tokens('[code]a [b]\n[/b] c[/ CODE ]')
+                assert [(tk.type, tk.text) for tk in tokens] == [
+                    (BBCodeToken.TK_START_TAG, '[code]'),
+                    (BBCodeToken.TK_DATA, 'a [b]\n[/b] c'),
+                    (BBCodeToken.TK_END_TAG, '[/ CODE ]'),
+                ]
+                for bbcodes_text, expected_html_text in tests:
+                    assert self.parser.render(bbcodes_text) == expected_html_text
+        finally:
+            self.parser.lexer = 'regex'
+
+    def test_can_render_texts_without_tags(self):
+        # Setup
+        parser = BBCodeParser()
+        parser.add_smiley(':)', '<img src="smile.png" />')
+        src = 'hello <world> :)\r\nsee www.example.com\n\nand foo.com/bar now\n'
+        dst = (
+            'hello &lt;world&gt; <img src="smile.png" /><br />see '
+            '<a href="http://www.example.com">www.example.com</a><br /><br />'
+            'and <a href="http://foo.com/bar">foo.com/bar</a> now<br />'
+        )
+        # Run & check
+        assert parser.render(src) == dst
+        # Smilies are never applied across lines
+        parser.add_smiley(')\n', '<hr />')
+        assert parser.render(src) == dst
+        assert parser.render('[' + src) == '[' + dst
+
+    def test_can_render_deeply_nested_tags(self):
+        # Setup
+        depth = sys.getrecursionlimit() * 2
+        src = '[quote]' * depth + '[b]hello[/b]' + '[/quote]' * depth
+        dst = '<blockquote>' * depth + '<strong>hello</strong>' + '</blockquote>' * depth
+        # Run & check
+        assert self.parser.render(src) == dst
+        assert self.parser.render(src[:-len('[/quote]')]) == \
+            '[quote]' + dst[len('<blockquote>'):-len('</blockquote>')]
+
+    def test_can_render_tags_wrapping_their_content(self):
+        # Setup
+        parser = BBCodeParser()
+        loader = BBCodeParserLoader(parser=parser)
+        loader.init_default_bbcode_placeholders()
+        loader.init_default_bbcode_tags()
+        tests = (
+            ('[quote] [b] hi [/b]\n[/quote]', '<blockquote><strong> hi </strong></blockquote>'),
+            ('[b]\n[/b]', '<strong><br /></strong>'),
+            ('[b]=[/b] [b=1]=[/b]', '[b][/b] [b]=[/b]'),
+            ('[b][i]![/i][/b]', '<strong>[i]![/i]</strong>'),
+            ('[quote][center] [/center][/quote]', '<blockquote>[center] [/center]</blockquote>'),
+        )
+        # Run & check
+        assert set(parser._wrapping_tags) == {'b', 'i', 'u', 's', '*', 'quote', 'center'}
+        for bbcodes_text, expected_html_text in tests:
+            assert parser.render(bbcodes_text) == expected_html_text
+
+    def test_can_dispatch_tags_through_their_option_flags(self):
+        # Setup
+        parser = BBCodeParser()
+        loader = BBCodeParserLoader(parser=parser)
+        loader.init_default_bbcode_placeholders()
+        loader.init_default_bbcode_tags()
+        # Run
+        tag_table = parser._get_tag_table()
+        # Check
+        assert sorted(tag_table.ids) == sorted(parser.bbcodes)
+        code_flags = tag_table.flags[tag_table.ids['code']]
+        assert not code_flags & parser_module.OPT_RENDER_EMBEDDED
+        assert code_flags & parser_module.OPT_REPLACE_LINKS
+        assert code_flags & parser_module.OPT_ESCAPE_HTML
+        assert tag_table.flags[tag_table.ids['*']] & parser_module.OPT_SAME_TAG_CLOSES
+        assert tag_table.wrapping_strings[tag_table.ids['b']] == \
+            ('<strong>', '</strong>', '[b]', '[/b]')
+        assert tag_table.wrapping_strings[tag_table.ids['url']] is None
+
+    def test_can_remove_bbcode_tags(self):
+        # Setup
+        parser = BBCodeParser()
+        loader = BBCodeParserLoader(parser=parser)
+        loader.init_default_bbcode_placeholders()
+        loader.init_default_bbcode_tags()
+        assert parser.render('[b]hello[/b]') == '<strong>hello</strong>'
+        # Run
+        parser.remove_bbcode_tag('b')
+        # Check
+        assert 'b' not in parser._get_tag_table().ids
+        assert 'b' not in parser._wrapping_tags
+        assert parser.render('[b]hello[/b]') == '[b]hello[/b]'
+        assert parser.render('[i]hello[/i]') == '<em>hello</em>'
+
+    def test_strip_and_transform_the_newlines_of_nested_tags_once_per_tag(self):
+        # Setup
+        parser = BBCodeParser()
+        loader = BBCodeParserLoader(parser=parser)
+        loader.init_default_bbcode_placeholders()
+        loader.init_default_bbcode_tags()
+        parser.newline_char = '<br />\n'
+        src = '[color=red] [quote] a\nb [/quote]\n[/color]\n[list]\n[*]one\n[/list]'
+        dst = (
+            '<span style="color:red;"> <blockquote>a<br /><br />\nb</blockquote><br />\n</span>'
+            '<br />\n<ul><li>one</li></ul>'
+        )
+        # Run & check
+        assert parser.render(src) == dst
+
+    def test_textual_transformations_do_not_span_several_tokens(self):
+        # Setup
+        parser = BBCodeParser()
+        loader = BBCodeParserLoader(parser=parser)
+        loader.init_default_bbcode_placeholders()
+        loader.init_default_bbcode_tags()
+        parser.add_smiley(':)', '<img src="smile.png" />')
+        src = 'see www.example.com[zz]/path :[zz]) :) [b]:[i])\nok :)[/b]'
+        dst = (
+            'see <a href="http://www.example.com">www.example.com</a>[zz]/path :[zz]) '
+            '<img src="smile.png" /> <strong>:[i])<br />ok <img src="smile.png" /></strong>'
+        )
+        # Run & check
+        assert parser.render(src) == dst
+
+    def test_can_replace_the_longest_smiley_codes_in_a_single_pass(self):
+        # Setup
+        parser = BBCodeParser()
+        parser.add_smiley(':)', '<img alt="8)" />')
+        parser.add_smiley('8)', '<img alt="cool" />')
+        parser.add_smiley(':-)', '<img alt="smile" />')
+        # Run & check
+        assert parser.render(':) 8) :-) :-:)') == (
+            '<img alt="8)" /> <img alt="cool" /> <img alt="smile" /> :-<img alt="8)" />')
+        parser.add_smiley('-:', '<img alt="tongue" />')
+        assert parser.render(':-:)') == ':<img alt="tongue" />)'
+
+    def test_do_not_replace_smiley_codes_inside_links(self):
+        # Setup
+        parser = BBCodeParser()
+        parser.add_smiley(':)', '<img src="smile.png" />')
+        parser.add_smiley(':D', '<img src="grin.png" />')
+        parser.add_smiley('www', '<img src="www.png" />')
+        # Run & check
+        assert parser.render(':D http://example.com/a:Db :D') == (
+            '<img src="grin.png" /> <a href="http://example.com/a:Db">http://example.com/a:Db</a> '
+            '<img src="grin.png" />')
+        assert parser.render('www.example.com :) www') == (
+            '<a href="http://www.example.com">www.example.com</a> <img src="smile.png" /> '
+            '<img src="www.png" />')
+        assert parser.render('see a.b.example.com/path:)') == (
+            'see <a href="http://a.b.example.com/path">a.b.example.com/path</a>'
+            '<img src="smile.png" />')
+        assert parser.render(':Dww.b.org/x?y=1 :)www.b.org/x') == (
+            '<img src="grin.png" />ww.b.org/x?y=1 <img src="smile.png" />'
+            '<a href="http://www.b.org/x">www.b.org/x</a>')
+
+    def test_can_cache_the_rendered_tag_subtrees(self):
+        # Setup
+        parser = BBCodeParser()
+        parser.subtree_cache = BytesLRUCache(maxbytes=2 ** 20)
+        loader = BBCodeParserLoader(parser=parser)
+        loader.init_default_bbcode_placeholders()
+        loader.init_default_bbcode_tags()
+        posts = []
+        for index in range(5):
+            body = '[b]Reply {}[/b] with some text and www.example.com links\n'.format(index) * 3
+            posts.append('[quote]{}[/quote]\n{}'.format(posts[-1], body) if posts else body)
+        # Run
+        rendered_posts = [parser.render(post) for post in posts]
+        # Check
+        assert parser.subtree_cache.hits == 3
+        assert rendered_posts == [self.parser.render(post) for post in posts]
+        assert parser.render('[center]{}[/center]'.format(posts[2])) == \
+            self.parser.render('[center]{}[/center]'.format(posts[2]))
+        assert parser.subtree_cache.hits == 4
+
+    def test_do_not_reuse_the_cached_subtrees_of_other_sources(self, monkeypatch):
+        # Setup
+        parser = BBCodeParser()
+        parser.subtree_cache = BytesLRUCache(maxbytes=2 ** 20)
+        loader = BBCodeParserLoader(parser=parser)
+        loader.init_default_bbcode_placeholders()
+        loader.init_default_bbcode_tags()
+        # All the subtrees of the same length have the same hash
+        monkeypatch.setattr(parser_module, '_SUBTREE_HASH_MODULUS', 1)
+        first_post = '[quote]{}[/quote]'.format('a' * 200)
+        second_post = '[quote]{}[/quote]'.format('b' * 200)
+        # Run & check
+        assert parser.render(first_post) == self.parser.render(first_post)
+        assert parser.render(second_post) == self.parser.render(second_post)
+        assert parser.render(first_post) == self.parser.render(first_post)
+
     def test_can_handle_unicode_inputs(self):
         # Setup
         src = '[center]ƒünk¥ 你好 • §tüƒƒ 你好[/center]'
@@ -0,0 +1,131 @@
+import time
+
+import pytest
+
+from precise_bbcode.bbcode import get_parser
+from precise_bbcode.core.cache import BytesLRUCache
+
+
+@pytest.mark.django_db
+class TestParserComplexity(object):
+    # Each pathological input is rendered for a base size and for a size that is GROWTH_FACTOR
+    # times greater. A linear behaviour should lead to a ratio close to GROWTH_FACTOR between the
+    # corresponding rendering times while a quadratic one would lead to a ratio close to its square.
+    GROWTH_FACTOR = 4
+    MAX_TIME_RATIO = 10
+
+    PATHOLOGICAL_INPUTS = (
+        # Unmatched opening brackets followed by a single ending bracket
+        (1000, lambda n: '[' * n + ']'),
+        (1000, lambda n: '[b' * n + ']'),
+        (1000, lambda n: '[url=' * n + ']'),
+        (250, lambda n: ('[' + 'a' * 200) * n + ']'),
+        (250, lambda n: ('[b' + ' ' * 200) * n + ']'),
+        (1000, lambda n: '[\n' * n + ']'),
+        # Missing ending brackets
+        (10000, lambda n: '[' * n),
+        (10000, lambda n: '[b' * n),
+        (1000, lambda n: 'hello [b' * n),
+        # Unmatched ending brackets
+        (10000, lambda n: ']' * n + '[' * n),
+        (1000, lambda n: '] [' * n + ']'),
+        # Long options without ending brackets
+        (10000, lambda n: '[b=' + 'x' * n + '\n]'),
+        # Unclosed tags whose content is raw text
+        (2000, lambda n: '[code]' * n),
+        (2000, lambda n: '[code]ab ' * n),
+        (2000, lambda n: '[b][code]x' * n),
+    )
+
+    DEEPLY_NESTED_INPUTS = (
+        # Unclosed quotes followed by stray end tags
+        (1000, lambda n: '[quote]' * n + '[/b]' * n),
+        (1000, lambda n: '[quote]' * n + 'hello [/i] world ' * n),
+        (1000, lambda n: ('[quote][b]' * n) + '[/u]' * n),
+        # Stray end tags closing the first opening tag of the stack
+        (1000, lambda n: '[b]' + '[quote]' * n + '[/i]' * n + '[/b]'),
+    )
+
+    NESTED_INPUTS = (
+        # Properly nested tags
+        (1000, lambda n: '[quote]' * n + 'hello' + '[/quote]' * n),
+        (500, lambda n: '[b][i]' * n + 'hello\nworld' + '[/i][/b]' * n),
+        (100, lambda n: '[list]' * n + '[*]item' + '[/list]' * n),
+    )
+
+    LIST_INPUTS = (
+        # Lists of items closed by the next item, by a newline or by the end of the list
+        (1250, lambda n: '[list]' + '[*]item' * n + '[/list]'),
+        (1250, lambda n: '[list]' + '[*][b]item[/b]\n' * n + '[/list]'),
+        (1250, lambda n: '[list=1]' + '[*]item[/*]' * n + '[/list]'),
+    )
+
+    LINK_INPUTS = (
+        # URL-like characters without a valid ending
+        (1000, lambda n: 'http://' + '!' * n),
+        (1000, lambda n: '[b]http://' + '(a' * n + '[/b]'),
+        (1000, lambda n: '-a' * n + '.com/' + '!' * n),
+        (1000, lambda n: '(http://' * n),
+        (1000, lambda n: 'awww.' * n),
+        (1000, lambda n: '.awww.' * n + 'com/' + '!' * n),
+    )
+
+    def setup_method(self, method):
+        self.parser = get_parser()
+
+    def get_rendering_time(self, data, repeat=3):
+        timings = []
+        for _ in range(repeat):
+            # The subtrees cached by a rendering are not reused by the next one
+            self.parser.subtree_cache.clear()
+            start = time.perf_counter()
+            self.parser.render(data)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def assert_renders_in_linear_time(self, inputs):
+        for size, build_input in inputs:
+            small_time = self.get_rendering_time(build_input(size))
+            large_time = self.get_rendering_time(build_input(size * self.GROWTH_FACTOR))
+            assert large_time < max(small_time, 0.001) * self.MAX_TIME_RATIO, repr(build_input(4))
+
+    def test_can_render_pathological_inputs_in_linear_time(self):
+        # Run & check
+        self.assert_renders_in_linear_time(self.PATHOLOGICAL_INPUTS)
+
+    def test_can_render_pathological_inputs_in_linear_time_with_the_legacy_lexer(self):
+        # Setup
+        default_lexer = self.parser.lexer
+        self.parser.lexer = 'legacy'
+        # Run & check
+        try:
+            self.assert_renders_in_linear_time(self.PATHOLOGICAL_INPUTS)
+        finally:
+            self.parser.lexer = default_lexer
+
+    def test_can_render_deeply_nested_inputs_in_linear_time(self):
+        # Run & check
+        self.assert_renders_in_linear_time(self.DEEPLY_NESTED_INPUTS)
+
+    def test_can_render_nested_tags_in_linear_time(self):
+        # Run & check
+        self.assert_renders_in_linear_time(self.NESTED_INPUTS)
+
+    def test_can_render_nested_tags_in_linear_time_with_the_subtree_cache(self):
+        # Setup
+        default_subtree_cache = self.parser.subtree_cache
+        self.parser.subtree_cache = BytesLRUCache(maxbytes=2 ** 24)
+        # Run & check
+        try:
+            self.assert_renders_in_linear_time(self.NESTED_INPUTS)
+            self.assert_renders_in_linear_time(self.DEEPLY_NESTED_INPUTS)
+        finally:
+            self.parser.subtree_cache = default_subtree_cache
+
+    def test_can_render_large_lists_in_linear_time(self):
+        # Run & check
+        self.assert_renders_in_linear_time(self.LIST_INPUTS)
+
+    def test_can_render_adversarial_links_in_linear_time(self):
+        # Run & check
+        self.assert_renders_in_linear_time(self.LINK_INPUTS)
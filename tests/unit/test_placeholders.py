@@ -3,8 +3,12 @@ import re
 import pytest
 from django.core.exceptions import ImproperlyConfigured
 
+from precise_bbcode.bbcode import BBCodeParser
 from precise_bbcode.bbcode import BBCodeParserLoader
 from precise_bbcode.bbcode import get_parser
+from precise_bbcode.bbcode.defaults.placeholder import ChoiceBBCodePlaceholder
+from precise_bbcode.bbcode.defaults.placeholder import RangeBBCodePlaceholder
+from precise_bbcode.bbcode.defaults.placeholder import TextBBCodePlaceholder
 from precise_bbcode.bbcode.defaults.placeholder import _color_re
 from precise_bbcode.bbcode.defaults.placeholder import _email_re
 from precise_bbcode.bbcode.defaults.placeholder import _number_re
@@ -50,6 +54,19 @@ class DummyPlaceholder(BBCodePlaceholder):
     pattern = re.compile(r'^[\w]*$')
 
 
+class LookupPlaceholder(BBCodePlaceholder):
+    name = 'lookup'
+
+    def validate(self, content, extra_context):
+        return {'foo': True}[content]
+
+
+class LookupBBCodeTag(BBCodeTag):
+    name = 'lookup'
+    definition_string = '[lookup]{LOOKUP}[/lookup]'
+    format_string = '<span>{LOOKUP}</span>'
+
+
 class FooBBCodeTag(BBCodeTag):
     name = 'xyz'
     definition_string = '[xyz]{FOO}[/xyz]'
@@ -287,3 +304,47 @@ class TestPlaceholder(object):
             class InvalidePlaceholder4(BBCodePlaceholder):
                 name = 'correctname'
                 pattern = 'incorrect pattern'
+
+    def test_are_bound_to_validators_when_tags_are_added_to_the_parser(self):
+        # Setup
+        parser = BBCodeParser()
+        parser_loader = BBCodeParserLoader(parser=parser)
+        parser_loader.init_default_bbcode_placeholders()
+        # Run
+        parser.add_bbcode_tag(SizeTag)
+        parser.add_bbcode_tag(DayTag)
+        # Check
+        size_validator = parser.bbcodes['siz']._placeholder_validators['RANGE=4,7']
+        assert size_validator('5') and size_validator('4.0')
+        assert not size_validator('8') and not size_validator('big')
+        day_validator = parser.bbcodes['day']._placeholder_validators[
+            'CHOICE=monday,tuesday,wednesday,tuesday,friday,saturday,sunday']
+        assert day_validator('friday')
+        assert not day_validator('thursday') and not day_validator('friday,saturday')
+
+    def test_are_bound_to_the_tags_that_were_added_before_them(self):
+        # Setup
+        parser = BBCodeParser()
+        parser.add_placeholder(TextBBCodePlaceholder)
+        parser.add_bbcode_tag(SizeTag)
+        parser.add_bbcode_tag(ErroredSizeTag)
+        # Run
+        parser.add_placeholder(RangeBBCodePlaceholder)
+        # Check
+        assert parser.render('[siz=5]hello[/siz]') == '<span style="font-size:5px;">hello</span>'
+        assert parser.render('[s2=5]hello[/s2]') == '[s2=5]hello[/s2]'
+
+    def test_bound_validators_raising_key_errors_are_reported_as_invalid_placeholders(self):
+        # Setup
+        parser = BBCodeParser()
+        parser.add_placeholder(LookupPlaceholder)
+        parser.add_bbcode_tag(LookupBBCodeTag)
+        # Run & check
+        assert parser.render('[lookup]foo[/lookup]') == '<span>foo</span>'
+        with pytest.raises(InvalidBBCodePlaholder):
+            parser.render('[lookup]bar[/lookup]')
+
+    def test_can_provide_validators_without_extra_context(self):
+        # Run & check
+        assert not RangeBBCodePlaceholder().get_validator()('5')
+        assert not ChoiceBBCodePlaceholder().get_validator()('monday')
@@ -192,6 +192,40 @@ class TestBbcodeTag(object):
         with pytest.raises(InvalidBBCodePlaholder):
             self.parser.render('[bad]apple[/bad]')
 
+    def test_have_a_render_plan_computed_at_class_creation(self):
+        # Setup
+        class TagWithRenderPlan(ParserBBCodeTag):
+            name = 'pct'
+            definition_string = '[pct={RANGE=0,100}]{TEXT}[/pct]'
+            format_string = '<div style="width:{RANGE=0,100}%;" title="{TEXT}">{{{TEXT}}}</div>'
+        # Run
+        render_plan = TagWithRenderPlan._render_plan
+        # Check
+        assert render_plan.option_placeholder == 'RANGE=0,100'
+        assert render_plan.content_placeholder == 'TEXT'
+        assert render_plan.placeholder_contexts == {
+            'RANGE=0,100': ('RANGE', '0,100'), 'TEXT': ('TEXT', '')}
+        assert render_plan.format_template == \
+            '<div style="width:%s%%;" title="%s">{{%s}}</div>'
+        assert render_plan.format_placeholders == ('RANGE=0,100', 'TEXT', 'TEXT')
+        assert render_plan.definition_template == '[pct=%s]%s[/pct]'
+        assert render_plan.definition_placeholders == ('RANGE=0,100', 'TEXT')
+
+    def test_can_be_rendered_using_their_render_plan(self):
+        # Setup
+        class TagWithRenderPlan(ParserBBCodeTag):
+            name = 'pct'
+            definition_string = '[pct={RANGE=0,100}]{TEXT}[/pct]'
+            format_string = '<div style="width:{RANGE=0,100}%;" title="{TEXT}">{{{TEXT}}}</div>'
+        parser = BBCodeParser()
+        parser_loader = BBCodeParserLoader(parser=parser)
+        parser_loader.init_default_bbcode_placeholders()
+        parser.add_bbcode_tag(TagWithRenderPlan)
+        # Run & check
+        assert parser.render('[pct=50]half[/pct]') == \
+            '<div style="width:50%;" title="half">{{half}}</div>'
+        assert parser.render('[pct=500]half[/pct]') == '[pct=500]half[/pct]'
+
 
 @pytest.mark.django_db
 class TestDbBbcodeTag(object):
@@ -0,0 +1,65 @@
+import pytest
+
+from precise_bbcode.bbcode import get_parser
+from precise_bbcode.core.validators import CachedURLValidator
+from precise_bbcode.core.validators import url_validator
+
+
+@pytest.mark.django_db
+class TestCachedURLValidator(object):
+    def test_can_validate_urls(self):
+        # Setup
+        validator = CachedURLValidator(maxsize=16)
+        # Run & check
+        assert validator.is_valid('http://example.com/foo?bar=1')
+        assert validator.is_valid('https://www.example.com')
+        assert not validator.is_valid('http://')
+        assert not validator.is_valid('example.com')
+        assert not validator.is_valid('javascript:alert(1)')
+
+    def test_memoize_the_validation_results(self):
+        # Setup
+        validator = CachedURLValidator(maxsize=16)
+        # Run
+        for _ in range(3):
+            validator.is_valid('http://example.com')
+            validator.is_valid('http://')
+        # Check
+        assert validator.misses == 2
+        assert validator.hits == 4
+
+    def test_evict_the_least_recently_used_results(self):
+        # Setup
+        validator = CachedURLValidator(maxsize=2)
+        validator.is_valid('http://a.com')
+        validator.is_valid('http://b.com')
+        validator.is_valid('http://a.com')
+        # Run
+        validator.is_valid('http://c.com')
+        validator.is_valid('http://a.com')
+        validator.is_valid('http://b.com')
+        # Check
+        assert validator.hits == 2
+        assert validator.misses == 4
+
+    def test_can_be_cleared(self):
+        # Setup
+        validator = CachedURLValidator(maxsize=16)
+        validator.is_valid('http://example.com')
+        validator.is_valid('http://example.com')
+        # Run
+        validator.clear()
+        # Check
+        assert validator.hits == 0
+        assert validator.misses == 0
+
+    def test_is_shared_by_the_url_tag_and_the_url_placeholder(self):
+        # Setup
+        parser = get_parser()
+        url_validator.clear()
+        # Run
+        parser.render('[url]http://example.com/shared[/url]')
+        parser.render('[img]http://example.com/shared[/img]')
+        # Check
+        assert url_validator.misses == 1
+        assert url_validator.hits == 1